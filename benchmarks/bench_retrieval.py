@@ -0,0 +1,132 @@
+# backend/benchmarks/bench_retrieval.py - Recherche RAG : ChromaDB vs matrice NumPy (float32 / float16)
+#
+# Lancement :  python benchmarks/bench_retrieval.py --sizes 1000 10000 50000 --queries 200
+# Corpus synthétique (vecteurs groupés en thèmes, dimension de all-MiniLM-L6-v2) : pas besoin du modèle.
+# Mesures par taille : latence p50/p95 par requête, mémoire (RSS ajouté par le backend, taille sur disque)
+# et rappel@k par rapport à la recherche exacte.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from src.rag_setup import INDEX_BATCH, ChromaBackend, NumpyBackend
+
+DIM = 384
+
+
+def rss_mb():
+    """Mémoire résidente du processus (Linux), ou None si indisponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def dir_mb(path: str) -> float:
+    total = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return total / 2**20
+
+
+def make_corpus(size: int, queries: int, seed: int = 0):
+    """Vecteurs normalisés répartis autour de sqrt(size) centres ; requêtes = documents bruités."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, int(size ** 0.5)), DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.6 * rng.standard_normal((size, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = rng.integers(0, size, queries)
+    noisy = vectors[picks] + 0.3 * rng.standard_normal((queries, DIM)).astype(np.float32)
+    noisy /= np.linalg.norm(noisy, axis=1, keepdims=True)
+    return vectors, noisy
+
+
+def rss_delta(before):
+    after = rss_mb()
+    return round(after - before, 1) if before is not None and after is not None else None
+
+
+def measure(backend, queries: np.ndarray, truth: list, top_k: int) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = backend.search(query, top_k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(found) & expected)
+    latencies.sort()
+    return {
+        "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+        "p95_ms": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 3),
+        "recall": round(hits / (top_k * len(queries)), 4),
+    }
+
+
+def bench_size(size: int, n_queries: int, top_k: int, workdir: str) -> dict:
+    vectors, queries = make_corpus(size, n_queries)
+    texts = [f"doc-{i}" for i in range(size)]
+    # Vérité terrain : recherche exacte en float32, en mémoire
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :top_k]
+    truth = [{texts[i] for i in row} for row in exact]
+
+    results = {}
+    before = rss_mb()
+    chroma_path = os.path.join(workdir, f"chroma_{size}")
+    collection = chromadb.PersistentClient(path=chroma_path).get_or_create_collection(name="bench")
+    start = time.perf_counter()
+    for i in range(0, size, INDEX_BATCH):
+        collection.add(
+            ids=texts[i:i + INDEX_BATCH],
+            embeddings=vectors[i:i + INDEX_BATCH].tolist(),
+            metadatas=[{"text": text} for text in texts[i:i + INDEX_BATCH]],
+        )
+    build_sec = time.perf_counter() - start
+    backend = ChromaBackend(collection)
+    backend.search(queries[0], top_k)      # 1re requête : chargement de l'index HNSW
+    results["chroma"] = dict(measure(backend, queries, truth, top_k), build_sec=round(build_sec, 2),
+                             disk_mb=round(dir_mb(chroma_path), 1), rss_mb=rss_delta(before))
+
+    for dtype in ("float32", "float16"):
+        numpy_path = os.path.join(workdir, f"numpy_{size}_{dtype}")
+        before = rss_mb()
+        backend = NumpyBackend(collection, path=numpy_path, dtype=dtype)
+        start = time.perf_counter()
+        backend.refresh()
+        build_sec = time.perf_counter() - start
+        backend.search(queries[0], top_k)  # Pages de la matrice chargées en mémoire
+        results[f"numpy_{dtype}"] = dict(measure(backend, queries, truth, top_k), build_sec=round(build_sec, 2),
+                                         disk_mb=round(dir_mb(numpy_path), 1), rss_mb=rss_delta(before))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des backends de recherche RAG")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--json", help="Fichier où écrire les résultats bruts")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_rag_")
+    report = {}
+    try:
+        print(f"{'taille':>8} {'backend':>14} {'p50 ms':>8} {'p95 ms':>8} {'rappel':>7} {'build s':>8} "
+              f"{'disque Mo':>10} {'RSS Mo':>8}")
+        for size in args.sizes:
+            results = bench_size(size, args.queries, args.top_k, workdir)
+            report[size] = results
+            for name, r in results.items():
+                print(f"{size:>8} {name:>14} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['recall']:>7} "
+                      f"{r['build_sec']:>8} {r['disk_mb']:>10} {str(r['rss_mb']):>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -1,14 +1,13 @@
-from src.llm_engine import LLMEngine
+from src.llm_router import ProviderRouter
 from src.rag_setup import retrieve_context
-from src.data_extractor import extract_data
 
 
-_llm_instance = LLMEngine()
+_llm_instance = ProviderRouter()
 
 def get_llm():
     return _llm_instance
 
-def set_llm(new_engine: LLMEngine):
+def set_llm(new_engine: ProviderRouter):
     global _llm_instance
     _llm_instance = new_engine
 
@@ -4,19 +4,41 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
-from fastapi.concurrency import run_in_threadpool
-from routers import security, performance, anomaly, backup, chat, utils
+from routers import security, performance, anomaly, backup, chat, utils, fleet, ingest
 from dependencies import set_llm
-from src.data_extractor import extract_data
-from src.llm_engine import LLMEngine
+from src.llm_engine import close_http_clients
+from src.llm_router import ProviderRouter
+from src.connection_pool import close_all
+from src.collector import collector
+from src.jobs import job_manager
+from src.rag_setup import rag
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Collecte périodique en arrière-plan (désactivable avec COLLECTOR_ENABLED=false)
+    if os.getenv("COLLECTOR_ENABLED", "true").lower() != "false":
+        collector.start()
+    # Modèle d'embedding et ChromaDB chargés dans un thread : l'API répond sans attendre (contexte générique d'ici là)
+    if os.getenv("RAG_WARMUP", "true").lower() != "false":
+        rag.start()
+    yield
+    # Arrêt : collecteur, jobs en cours puis fermeture des pools Oracle et des connexions HTTP LLM
+    await collector.stop()
+    job_manager.shutdown()
+    close_all()
+    await close_http_clients()
+
 
 app = FastAPI(
     title="Plateforme Intelligente Oracle avec IA - API",
     description="Backend FastAPI pour le projet DBA 2026",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 # ========================
@@ -39,6 +61,8 @@ app.include_router(anomaly.router)
 app.include_router(backup.router)
 app.include_router(chat.router)
 app.include_router(utils.router)
+app.include_router(fleet.router)
+app.include_router(ingest.router)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -54,19 +78,22 @@ async def root():
 async def connect_and_refresh(config: dict = Body(...)):
     """
     Reçoit la config Oracle + choix LLM de l'utilisateur
-    Extrait les données de SA base et configure le LLM
+    Lance l'extraction de SA base en arrière-plan et configure le LLM.
+    Répond immédiatement avec le job_id à suivre sur /utils/jobs/{job_id}.
     """
     try:
-        # Extraction des données avec la config utilisateur (Exécuté dans un thread séparé)
-        message = await run_in_threadpool(extract_data, config)
+        # Extraction en tâche de fond : la requête HTTP n'attend plus la fin de l'extraction.
+        # La collecte périodique ne suit cette base qu'une fois l'extraction réussie (identifiants validés).
+        job = job_manager.submit(config, on_success=collector.set_target)
         
         # Configuration du LLM selon le choix utilisateur
         provider = config.get("llm_provider", "groq")
         gemini_key = config.get("gemini_api_key", None)
         
-        new_llm = LLMEngine(
+        # Routeur : le fournisseur choisi en premier, les autres fournisseurs configurés en secours
+        new_llm = ProviderRouter(
             provider=provider,
-            gemini_api_key=gemini_key if provider == "gemini" else None,
+            gemini_api_key=gemini_key,
             ollama_model="phi3:mini"
         )
         
@@ -76,8 +103,9 @@ async def connect_and_refresh(config: dict = Body(...)):
         print(f"LLM configuré : {provider.upper()}")
         
         return {
-            "message": f"{message} | LLM : {provider.upper()} configuré",
-            "status": "success"
+            "message": f"Extraction lancée (job {job.id}) | LLM : {provider.upper()} configuré",
+            "status": "success",
+            "job_id": job.id
         }
         
     except Exception as e:
@@ -1,14 +1,27 @@
 # routers/chat.py - Version FINALE corrigée
 
+import json
 from fastapi import APIRouter, Body, HTTPException
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from dependencies import get_llm, get_rag_context
+from src.rag_setup import is_degraded
+from src.semantic_cache import semantic_cache
+from src.rate_limiter import INTERACTIVE
 import logging
 
 router = APIRouter(prefix="/chat", tags=["Chatbot"])
 
 logger = logging.getLogger(__name__)
 
+DBA_CONTEXT = "Tu es un expert DBA Oracle. Réponds en français, clair, structuré et professionnel."
+
+
+def _sse(data: dict, event: str = None) -> str:
+    # Un événement Server-Sent Events ; le JSON protège les retours à la ligne du texte
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/")
 async def chat(payload: dict = Body(...)):
     """
@@ -24,21 +37,84 @@ async def chat(payload: dict = Body(...)):
     try:
         logger.info(f"Requête reçue : {query[:100]}...")
 
+        # Question déjà posée (même formulée autrement) depuis le dernier changement de données
+        cached = await run_in_threadpool(semantic_cache.lookup, query)
+        if cached is not None:
+            answer, similarity, original = cached
+            logger.info(f"Réponse servie par le cache sémantique (similarité {similarity:.3f} avec : {original[:60]})")
+            return {"response": answer, "cached": True, "similarity": round(similarity, 3)}
+
         # Récupération du contexte RAG
         context = get_rag_context(query)
         
-        # Génération avec Gemini (Exécuté dans un thread séparé)
-        response_text = await run_in_threadpool(
-            get_llm().generate,
+        # Génération asynchrone (client HTTP partagé, sans passer par le threadpool)
+        response_text = await get_llm().agenerate(
             prompt=query,
             context=context,
-            user_context="Tu es un expert DBA Oracle. Réponds en français, clair, structuré et professionnel."
+            user_context=DBA_CONTEXT,
+            priority=INTERACTIVE  # Passe devant les analyses en attente de quota
         )
         
         logger.info(f"Réponse générée ({len(response_text)} caractères)")
+        if not response_text.startswith("Erreur") and not is_degraded(context):
+            await run_in_threadpool(semantic_cache.store, query, response_text.strip())
         return {"response": response_text.strip()}
     
     except Exception as e:
         error_msg = f"Erreur génération : {str(e)}"
         logger.error(error_msg)
-        return {"response": f"Désolé, une erreur est survenue : {error_msg}. Réessayez ou contactez le support."}
\ No newline at end of file
+        return {"response": f"Désolé, une erreur est survenue : {error_msg}. Réessayez ou contactez le support."}
+
+
+@router.post("/stream")
+async def chat_stream(payload: dict = Body(...)):
+    """
+    Variante streaming de /chat : réponse en Server-Sent Events.
+    Evénements : `data: {"delta": "..."}` par morceau, puis `event: done` (ou `event: error`).
+    """
+    query = payload.get("query", "")
+
+    async def events():
+        if not query.strip():
+            yield _sse({"delta": "Pose-moi une vraie question sur ta base Oracle ! 😊"})
+            yield _sse({"cached": False}, event="done")
+            return
+
+        cached = await run_in_threadpool(semantic_cache.lookup, query)
+        if cached is not None:
+            answer, similarity, _ = cached
+            yield _sse({"delta": answer})
+            yield _sse({"cached": True, "similarity": round(similarity, 3)}, event="done")
+            return
+
+        parts = []
+        try:
+            context = get_rag_context(query)
+            async for chunk in get_llm().astream(prompt=query, context=context, user_context=DBA_CONTEXT,
+                                                 priority=INTERACTIVE):
+                parts.append(chunk)
+                yield _sse({"delta": chunk})
+        except Exception as e:
+            logger.error(f"Erreur génération (stream) : {e}")
+            yield _sse({"error": f"Erreur génération : {str(e)}"}, event="error")
+            return
+
+        answer = "".join(parts).strip()
+        if answer and not answer.startswith("Erreur") and not is_degraded(context):
+            await run_in_threadpool(semantic_cache.store, query, answer)
+        yield _sse({"cached": False}, event="done")
+
+    # X-Accel-Buffering : empêche un éventuel reverse proxy de bufferiser le flux
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/cache")
+async def get_semantic_cache_stats():
+    """Taille, seuil et taux de réussite du cache sémantique."""
+    return semantic_cache.stats()
+
+
+@router.delete("/cache")
+async def clear_semantic_cache():
+    semantic_cache.clear()
+    return {"status": "success", "message": "Cache sémantique vidé"}
@@ -0,0 +1,35 @@
+from typing import Optional
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from src import fleet
+
+router = APIRouter(prefix="/fleet", tags=["Flotte"])
+
+@router.get("/targets")
+async def get_targets():
+    """Cibles déclarées dans data/fleet.yaml et résultat de leur dernière extraction."""
+    return fleet.fleet_status()
+
+@router.post("/refresh")
+async def refresh(payload: dict = Body(default={})):
+    """
+    Extrait toutes les cibles en parallèle (concurrence bornée par max_parallel).
+    Body optionnel : {"targets": ["sales_pdb"], "stages": ["slow_queries"]}
+    """
+    if not fleet.is_enabled():
+        raise HTTPException(status_code=404, detail=f"Aucune cible dans {fleet.FLEET_FILE}")
+    return await run_in_threadpool(fleet.refresh_fleet, payload.get("stages"), payload.get("targets"))
+
+@router.get("/slow-queries")
+async def get_fleet_slow_queries(limit: int = 10, window: Optional[int] = None, metric: str = "elapsed_sec"):
+    """Top des requêtes lentes sur toute la flotte (charge récente si `window` est fourni)."""
+    try:
+        queries = await run_in_threadpool(fleet.top_slow_sql, limit, window, metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"queries": queries}
+
+@router.get("/security-summary")
+async def get_security_summary():
+    """Score de sécurité de chaque cible, les plus exposées en premier."""
+    return {"targets": await run_in_threadpool(fleet.security_summary)}
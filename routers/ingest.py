@@ -0,0 +1,39 @@
+import os
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from src import ingest
+
+router = APIRouter(prefix="/ingest", tags=["Ingestion RAG"])
+
+class IngestRequest(BaseModel):
+    paths: List[str] = ["."]          # Relatifs à INGEST_ROOT (dossier "docs" par défaut)
+    workers: Optional[int] = None     # Processus d'encodage (INGEST_WORKERS par défaut)
+
+def _resolve(path: str) -> str:
+    root = os.path.realpath(ingest.INGEST_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if resolved != root and not resolved.startswith(root + os.sep):
+        raise HTTPException(status_code=400, detail=f"Chemin hors de {ingest.INGEST_ROOT} : {path}")
+    if not os.path.exists(resolved):
+        raise HTTPException(status_code=404, detail=f"Introuvable : {path}")
+    return resolved
+
+@router.post("/")
+async def start_ingestion(request: IngestRequest):
+    """
+    Lance l'ingestion (PDF, Markdown, HTML, texte) en arrière-plan ; suivi sur GET /ingest/status.
+    Exemple de JSON body :
+    {
+        "paths": ["oracle/rman_guide.pdf", "runbooks/"]
+    }
+    """
+    paths = [_resolve(path) for path in request.paths]
+    if not ingest.start(paths, request.workers or ingest.WORKERS):
+        raise HTTPException(status_code=409, detail="Une ingestion est déjà en cours")
+    return {"status": "accepted", "paths": paths}
+
+@router.get("/status")
+async def ingestion_status():
+    """Phase en cours, ou rapport de la dernière ingestion (volumes, durées, débit)."""
+    return ingest.status
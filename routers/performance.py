@@ -1,19 +1,40 @@
-from fastapi import APIRouter, Body
+from typing import Optional
+from fastapi import APIRouter, Body, HTTPException
 from src.query_optimizer import optimize_query
-import pandas as pd
+from src import snapshot_store
+from src.sql_sampler import get_sampler
 
 router = APIRouter(prefix="/performance", tags=["Performance"])
 
 @router.get("/slow-queries")
-async def get_slow_queries():
+async def get_slow_queries(window: Optional[int] = None, metric: str = "elapsed_sec"):
+    """
+    Sans `window` : top 5 du dernier snapshot cumulé de V$SQL.
+    Avec `window` (secondes) : top 5 par charge récente (deltas V$SQL sur la fenêtre), classé par `metric`.
+    """
+    if window:
+        sampler = get_sampler()
+        if sampler.samples > 1:
+            try:
+                queries = sampler.top(window, metric=metric, limit=5)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return {"queries": queries, "source": "deltas", "window_sec": window, "metric": metric}
+
     try:
-        df = pd.read_csv('../data/slow_queries.csv')
+        df = snapshot_store.read_table(
+            "slow_queries", columns=["sql_id", "sql_text", "executions", "elapsed_sec", "disk_reads", "buffer_gets"]
+        )
         queries = df.head(5).to_dict(orient='records')
-        return {"queries": queries}
+        return {"queries": queries, "source": "snapshot"}
     except:
         return {"queries": []}
 
 @router.post("/optimize")
 async def optimize(sql: str = Body(..., embed=True)):
     result = await optimize_query(sql, "Plan probable avec Full Table Scan ou index manquant")
-    return result
\ No newline at end of file
+    return result
+
+@router.get("/sampler-stats")
+async def get_sampler_stats():
+    return get_sampler().stats()
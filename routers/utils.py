@@ -1,12 +1,112 @@
-from fastapi import APIRouter
-from src.data_extractor import extract_data  # import ton fonction existante
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from src.connection_pool import pool_stats
+from src import data_extractor, snapshot_store, llm_engine, llm_replay
+from src.collector import collector
+from src.jobs import job_manager
+from src.rate_limiter import limiter_stats
+from src.prompt_budget import usage_stats
+from src.rag_setup import rag
+from dependencies import get_llm
 
 router = APIRouter(prefix="/utils", tags=["Utilitaires"])
 
 @router.post("/refresh-data")
-async def refresh_data():
+async def refresh_data(payload: dict = Body(default={})):
+    """
+    Lance l'extraction en arrière-plan et retourne immédiatement l'identifiant du job.
+    Body : config Oracle (host, port, service, user, password), et optionnellement "stages".
+    Sans config, la cible du collecteur (dernière connexion ou .env) est utilisée.
+    """
+    config = {k: v for k, v in payload.items() if k != "stages"} or collector.config
+    if not config:
+        return {"status": "error", "message": "Aucune configuration Oracle : connectez-vous ou renseignez le .env"}
     try:
-        result = extract_data()  # exécute l'extraction
-        return {"status": "success", "message": result}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        job = job_manager.submit(config, payload.get("stages"))
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "accepted", "job_id": job.id}
+
+@router.get("/jobs")
+async def list_jobs():
+    return {"jobs": job_manager.list()}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progression par étape et résultat d'une extraction."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job.to_dict()
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return {"cancelled": job.cancel(), "job": job.to_dict()}
+
+@router.get("/pool-stats")
+async def get_pool_stats():
+    """Etat du registre de pools Oracle (connexions ouvertes / occupées par cible)."""
+    return {"pools": pool_stats()}
+
+
+@router.get("/extraction-stats")
+async def get_extraction_stats():
+    """Durée de chaque requête lors de la dernière extraction."""
+    return data_extractor.last_run
+
+
+@router.get("/collector-status")
+async def get_collector_status():
+    """Dernière exécution, durée et état de chaque tâche de collecte périodique."""
+    return collector.get_status()
+
+@router.get("/snapshot-manifest")
+async def get_snapshot_manifest():
+    """Empreinte de chaque dataset et datasets modifiés lors du dernier rafraîchissement."""
+    return snapshot_store.load_manifest()
+
+@router.get("/llm-cache")
+async def get_llm_cache_stats():
+    """Taille, hits/misses et évictions du cache de réponses LLM."""
+    stats = await run_in_threadpool(get_llm().cache.stats)     # Requêtes SQLite : hors de la boucle
+    # Appels dédoublonnés : prompts identiques arrivés pendant qu'un appel était déjà en cours
+    stats["single_flight"] = {"sync": llm_engine.inflight.stats(), "async": llm_engine.ainflight.stats()}
+    return stats
+
+@router.delete("/llm-cache")
+async def clear_llm_cache():
+    await run_in_threadpool(get_llm().cache.clear)
+    return {"status": "success"}
+
+@router.get("/llm-limits")
+async def get_llm_limits():
+    """Par fournisseur : jetons, concurrence adaptative, profondeur de file et temps d'attente par priorité."""
+    return limiter_stats()
+
+@router.get("/llm-providers")
+async def get_llm_providers():
+    """Latences p50/p95, taux d'erreur et ordre de routage des fournisseurs LLM."""
+    return get_llm().stats()
+
+@router.get("/prompt-usage")
+async def get_prompt_usage():
+    """Tokens envoyés par analyseur et par fournisseur (moyenne, max, appels rognés)."""
+    return usage_stats()
+
+@router.get("/llm-replay")
+async def get_llm_replay_stats():
+    """Mode LLM (live / record / replay), enregistrements disponibles et hits/misses du rejeu."""
+    return llm_replay.recordings.stats()
+
+@router.get("/startup-report")
+async def get_startup_report():
+    """Etat du service RAG et durée de chaque étape de son chargement (import, modèle, ChromaDB, indexation)."""
+    return {"rag": rag.startup_report()}
+
+@router.get("/rag-cache")
+async def get_rag_cache_stats():
+    """Version du corpus, hits/misses des caches d'embeddings et de résultats, requêtes précalculées."""
+    return rag.cache_stats()
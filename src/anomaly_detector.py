@@ -1,49 +1,87 @@
 import json
 from dependencies import get_llm
-from src.rag_setup import retrieve_context
+from src.rag_setup import precompute, retrieve_context
+from src import snapshot_store
+from src.prompt_budget import Section, build_prompt, compact_records, count_tokens
 import time
 import logging
-from fastapi.concurrency import run_in_threadpool
 
 logger = logging.getLogger(__name__)
 
-async def detect_anomalies(log_file="data/synthetic_logs.json"):
+# Requête RAG fixe : résultat calculé dès l'indexation du corpus
+RAG_QUERY = "oracle audit anomaly sql injection"
+precompute(RAG_QUERY, top_k=2)
+
+# Dernière analyse, associée à l'empreinte du journal d'audit analysé (cf. manifeste du snapshot_store)
+_last_analysis = {"fingerprint": None, "results": None, "stats": None}
+
+def _tail_audit_store(max_logs):
+    """Les `max_logs` événements les plus récents du journal d'audit, sans charger tout l'historique."""
+    tail = snapshot_store.read_tail("audit_trail", max_logs)
+    # Le journal est trié par event_timestamp croissant : on remet les plus récents en tête
+    return json.loads(tail.iloc[::-1].to_json(orient="records", date_format="iso"))
+
+async def detect_anomalies(log_file=None):
     start = time.time()
     results = []
     stats = {"precision": 0.0, "recall": 0.0, "total_logs": 0, "errors": 0}
 
+    # Limite pour éviter de saturer le context window
+    max_logs = 10
+
+    # Journal incrémental alimenté par l'extraction, sinon logs de démonstration
+    fingerprint = None
     try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-        stats["total_logs"] = len(logs)
+        if log_file is None:
+            fingerprint = snapshot_store.fingerprints(["audit_trail"])["audit_trail"]
+            if fingerprint and fingerprint == _last_analysis["fingerprint"]:
+                logger.info("Journal d'audit inchangé : analyse précédente réutilisée")
+                return _last_analysis["results"], _last_analysis["stats"]
+        total_logs = snapshot_store.count_rows("audit_trail") if log_file is None else 0
+        if total_logs:
+            log_file = "audit_trail"
+            logs_to_analyze = _tail_audit_store(max_logs)
+        else:
+            log_file = log_file or "data/synthetic_logs.json"
+            with open(log_file, "r", encoding="utf-8") as f:
+                logs = json.load(f)
+            logs_to_analyze, total_logs = logs[:max_logs], len(logs)
+        stats["total_logs"] = total_logs
     except Exception as e:
         logger.error(f"Impossible de lire {log_file} : {e}")
         return [], stats
 
-    if not logs:
+    if not logs_to_analyze:
         return [], stats
-
-    # Limite pour éviter de saturer le context window
-    max_logs = 10 
-    logs_to_analyze = logs[:max_logs]
     
-    # Batching : On envoie tout d'un coup
-    logs_block = json.dumps(logs_to_analyze, indent=2, ensure_ascii=False)
+    # Batching : On envoie tout d'un coup, en CSV dense (au lieu d'un JSON indenté) avec le log_index en 1re colonne
+    logs_block = compact_records(logs_to_analyze, index_name="log_index")
     
-    user_context = f"Base avec {len(logs)} logs. Focus DBA : Injection SQL, Escalade privilèges, Accès hors heures."
-    context = "\n".join(retrieve_context("oracle audit anomaly sql injection", top_k=2))
+    user_context = f"Base avec {stats['total_logs']} logs. Focus DBA : Injection SQL, Escalade privilèges, Accès hors heures."
+    context = "\n".join(retrieve_context(RAG_QUERY, top_k=2))
 
-    prompt = (
-        f"Analyse ces {len(logs_to_analyze)} logs d'audit Oracle ci-dessous.\n"
-        f"Pour CHAQUE log, détermine s'il est 'normal', 'suspect' ou 'critique'.\n"
-        f"LOGS :\n{logs_block}\n\n"
-        f"REPONDS UNIQUEMENT avec un tableau JSON de la forme :\n"
-        f"[{{'log_index': 0, 'classification': 'critique', 'justification': '...'}}, ...]"
+    # Budget de tokens : au besoin, les logs les plus anciens (en fin de tableau) sont retirés
+    llm = get_llm()
+    prompt, _ = build_prompt(
+        [
+            Section("intro", (
+                f"Analyse ces {len(logs_to_analyze)} logs d'audit Oracle ci-dessous.\n"
+                f"Pour CHAQUE log, détermine s'il est 'normal', 'suspect' ou 'critique'."
+            ), priority=0),
+            Section("logs", logs_block, priority=1, tabular=True, title="LOGS (CSV) :"),
+            Section("format", (
+                f"REPONDS UNIQUEMENT avec un tableau JSON de la forme :\n"
+                f"[{{'log_index': 0, 'classification': 'critique', 'justification': '...'}}, ...]"
+            ), priority=0),
+        ],
+        llm.provider,
+        budget=llm.token_budget,
+        tag="detect_anomalies",
+        reserve=count_tokens(context, llm.provider) + count_tokens(user_context, llm.provider),
     )
 
     try:
-        response_text = await run_in_threadpool(
-            get_llm().generate,
+        response_text = await llm.agenerate(
             prompt,
             context=context,
             user_context=user_context
@@ -68,5 +106,8 @@ async def detect_anomalies(log_file="data/synthetic_logs.json"):
         # Fallback si échec du batch : on retourne liste vide ou erreur
         stats["errors"] = 1
 
+    if log_file == "audit_trail" and not stats["errors"]:
+        _last_analysis.update({"fingerprint": fingerprint, "results": results, "stats": stats})
+
     logger.info(f"Anomalies détectées en {time.time() - start:.2f}s (Batch)")
     return results, stats
\ No newline at end of file
@@ -1,8 +1,11 @@
 import asyncio
 from dependencies import get_llm
-from src.rag_setup import retrieve_context
+from src.rag_setup import precompute, retrieve_context
 import time
-from fastapi.concurrency import run_in_threadpool
+
+# Requête RAG fixe : résultat calculé dès l'indexation du corpus
+RAG_QUERY = "oracle backup rman rpo rto"
+precompute(RAG_QUERY, top_k=3)
 
 async def recommend_backup(rpo: str, rto: str, budget: str):
     start = time.time()
@@ -10,18 +13,17 @@ async def recommend_backup(rpo: str, rto: str, budget: str):
     user_context = "Base utilisateur de 1GB, 50 tables, critique. Détecte changements depuis dernière backup (ex. nouvelles tables)."
 
     # RAG réduit
-    context = "\n".join(retrieve_context("oracle backup rman rpo rto", top_k=3))
+    context = "\n".join(retrieve_context(RAG_QUERY, top_k=3))
 
-    # Lancement parallèle
-    task_strategy = run_in_threadpool(
-        get_llm().generate,
+    # Lancement parallèle (coroutines sur le même client HTTP)
+    llm = get_llm()
+    task_strategy = llm.agenerate(
         f"Recommande stratégie RMAN pour RPO:{rpo}, RTO:{rto}, Budget:{budget}. Orientation DBA.",
         context=context,
         user_context=user_context
     )
 
-    task_script = run_in_threadpool(
-        get_llm().generate,
+    task_script = llm.agenerate(
         f"Ecris uniquement un Script RMAN complet pour respecter RPO:{rpo} et RTO:{rto}.",
         context=context,
         user_context=user_context
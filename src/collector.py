@@ -0,0 +1,157 @@
+# backend/src/collector.py - Collecte périodique en arrière-plan (asyncio)
+
+import asyncio
+import os
+import random
+import time
+from src.data_extractor import run_extraction
+from src import fleet
+
+# Tâches de collecte : nom -> (étapes d'extraction, intervalle en secondes)
+DEFAULT_JOBS = {
+    "sql_deltas": (["sql_deltas"], 60),
+    "slow_queries": (["slow_queries"], 300),
+    "audit": (["audit"], 300),
+    "security": (["users", "roles", "privs"], 3600),
+}
+
+JITTER = 0.1            # +/- 10 % sur chaque intervalle, pour ne pas synchroniser les tâches
+MAX_BACKOFF = 1800      # Plafond du backoff exponentiel après échecs (30 min)
+
+
+def config_from_env():
+    """Cible Oracle lue dans le .env (ORACLE_HOST, ...), ou None si incomplète."""
+    config = {
+        "host": os.getenv("ORACLE_HOST"),
+        "port": os.getenv("ORACLE_PORT", "1521"),
+        "service": os.getenv("ORACLE_SERVICE"),
+        "user": os.getenv("ORACLE_USER"),
+        "password": os.getenv("ORACLE_PASSWORD"),
+    }
+    if not all(config.values()):
+        return None
+    return config
+
+
+class Collector:
+    """
+    Lance chaque tâche de collecte dans sa propre boucle asyncio, avec jitter,
+    backoff exponentiel en cas d'échec et protection contre les exécutions qui se chevauchent.
+    L'extraction (bloquante) s'exécute dans un thread via asyncio.to_thread.
+    """
+
+    def __init__(self, jobs: dict = None):
+        self.jobs = jobs or DEFAULT_JOBS
+        self.config = None
+        self._tasks = []
+        self._running = set()
+        self.status = {
+            name: {
+                "stages": stages,
+                "interval_sec": interval,
+                "runs": 0,
+                "last_start": None,
+                "last_end": None,
+                "last_duration_sec": None,
+                "last_status": "pending",
+                "last_error": None,
+                "consecutive_failures": 0,
+                "next_run": None,
+            }
+            for name, (stages, interval) in self.jobs.items()
+        }
+
+    def set_target(self, config: dict):
+        """Change la base collectée (appelé à chaque /connect-and-refresh)."""
+        self.config = config
+
+    def _next_delay(self, name: str) -> float:
+        interval = self.jobs[name][1]
+        failures = self.status[name]["consecutive_failures"]
+        delay = min(interval * (2 ** failures), max(MAX_BACKOFF, interval)) if failures else interval
+        return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+    async def run_job(self, name: str):
+        """Exécute une tâche une fois (ignorée si elle tourne déjà ou si aucune cible n'est configurée)."""
+        status = self.status[name]
+        try:
+            fleet_mode = fleet.is_enabled()
+        except Exception as e:
+            # Ne doit pas arriver (load_fleet se rabat sur une flotte vide), mais ne doit jamais tuer la boucle
+            print(f"⚠️ Lecture de la flotte impossible : {e}")
+            fleet_mode = False
+        if self.config is None and not fleet_mode:
+            status["last_status"] = "no_target"
+            return
+        if name in self._running:
+            status["last_status"] = "skipped_overlap"
+            return
+
+        self._running.add(name)
+        status["last_start"] = time.time()
+        status["last_status"] = "running"
+        try:
+            stages = self.jobs[name][0]
+            attempted, failed = 0, []
+            if self.config is not None:
+                attempted += 1
+                try:
+                    await asyncio.to_thread(run_extraction, self.config, stages)
+                except Exception as e:
+                    failed.append(f"principale ({e})")
+            if fleet_mode:
+                # Mode flotte : le même cycle couvre aussi toutes les cibles de data/fleet.yaml
+                result = await asyncio.to_thread(fleet.refresh_fleet, stages)
+                attempted += len(result["targets"])
+                failed += [t for t, r in result["targets"].items() if r["status"] != "success"]
+
+            if failed and len(failed) == attempted:
+                raise RuntimeError(f"Toutes les cibles en échec : {', '.join(failed)}")
+            status["last_error"] = f"Cibles en échec : {', '.join(failed)}" if failed else None
+            status["last_status"] = "partial" if failed else "success"
+            status["consecutive_failures"] = 0
+        except Exception as e:
+            status["last_status"] = "error"
+            status["last_error"] = str(e)
+            status["consecutive_failures"] += 1
+            print(f"⚠️ Collecte {name} en échec ({status['consecutive_failures']}x) : {e}")
+        finally:
+            self._running.discard(name)
+            status["runs"] += 1
+            status["last_end"] = time.time()
+            status["last_duration_sec"] = round(status["last_end"] - status["last_start"], 3)
+
+    async def _loop(self, name: str):
+        # Premier passage étalé sur quelques secondes pour ne pas tout lancer au démarrage
+        delay = random.uniform(0, 5)
+        while True:
+            self.status[name]["next_run"] = time.time() + delay
+            await asyncio.sleep(delay)
+            await self.run_job(name)
+            delay = self._next_delay(name)
+
+    def start(self):
+        if self._tasks:
+            return
+        if self.config is None:
+            self.config = config_from_env()
+        self._tasks = [asyncio.create_task(self._loop(name), name=f"collector-{name}") for name in self.jobs]
+        print(f"Collecteur démarré ({', '.join(self.jobs)})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_status(self) -> dict:
+        return {
+            "running": bool(self._tasks),
+            "fleet_mode": fleet.is_enabled(),
+            "fleet_error": fleet.load_error,
+            "target": f"{self.config['user']}@{self.config['host']}/{self.config['service']}" if self.config else None,
+            "jobs": self.status,
+        }
+
+
+collector = Collector()
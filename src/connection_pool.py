@@ -0,0 +1,228 @@
+# backend/src/connection_pool.py - Registre de pools Oracle partagés (mode thin)
+
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+import oracledb
+
+# Les CLOB (ex. sql_text de l'audit unifié) sont récupérés directement en str
+oracledb.defaults.fetch_lobs = False
+
+# Paramètres par défaut des pools (surchargables via la config utilisateur)
+POOL_MIN = 1
+POOL_MAX = 5
+POOL_INCREMENT = 1
+PING_INTERVAL = 60        # Secondes avant qu'une connexion inactive soit re-pingée par oracledb
+MAX_IDLE_SECONDS = 900    # Un pool inutilisé depuis 15 min est fermé
+WAIT_TIMEOUT = 60         # Secondes d'attente max d'une connexion libre (pool saturé par une requête bloquée)
+
+_pools = {}
+_retired = []             # Pools remplacés alors que des connexions étaient encore empruntées
+_lock = threading.Lock()
+
+
+def _pool_key(config: dict) -> tuple:
+    """Clé du registre : (host, port, service, user)."""
+    return (
+        str(config["host"]).lower(),
+        int(config["port"]),
+        str(config["service"]).lower(),
+        str(config["user"]).upper(),
+    )
+
+
+def _password_digest(password: str) -> str:
+    # On ne garde jamais le mot de passe en clair dans le registre
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
+def _create_pool(config: dict):
+    dsn = oracledb.makedsn(host=config["host"], port=int(config["port"]), service_name=config["service"])
+    return oracledb.create_pool(
+        user=config["user"],
+        password=config["password"],
+        dsn=dsn,
+        min=int(config.get("pool_min", POOL_MIN)),
+        max=int(config.get("pool_max", POOL_MAX)),
+        increment=POOL_INCREMENT,
+        ping_interval=PING_INTERVAL,
+        getmode=oracledb.POOL_GETMODE_WAIT,
+        wait_timeout=int(float(config.get("pool_wait_timeout", WAIT_TIMEOUT)) * 1000),  # En millisecondes
+    )
+
+
+def _close_entry(entry: dict):
+    try:
+        entry["pool"].close(force=True)
+    except Exception as e:
+        print(f"⚠️ Fermeture pool impossible : {e}")
+
+
+def _busy(pool) -> int:
+    try:
+        return pool.busy
+    except oracledb.Error:
+        return 0
+
+
+def _retire(entry: dict):
+    """Sortie du registre (appelé sous _lock) : fermé tout de suite s'il est libre, sinon quand il le sera."""
+    if _busy(entry["pool"]) > 0:
+        _retired.append(entry)
+    else:
+        _close_entry(entry)
+
+
+def _close_retired() -> int:
+    with _lock:
+        idle = [entry for entry in _retired if _busy(entry["pool"]) == 0]
+        _retired[:] = [entry for entry in _retired if entry not in idle]
+    for entry in idle:
+        _close_entry(entry)
+    return len(idle)
+
+
+def _timed_out(error: oracledb.Error) -> bool:
+    # DPY-4005 : aucune connexion rendue avant wait_timeout ; le pool est saturé, pas invalide
+    return getattr(error.args[0] if error.args else None, "full_code", None) == "DPY-4005"
+
+
+def get_pool(config: dict):
+    """
+    Retourne le pool associé à la cible, en le créant au besoin.
+    Un pool est recréé si le mot de passe a changé ou s'il a été fermé.
+    """
+    key = _pool_key(config)
+    digest = _password_digest(config["password"])
+
+    with _lock:
+        entry = _pools.get(key)
+        if entry is not None and entry["password"] != digest:
+            _retire(entry)
+            entry = None
+
+        if entry is None:
+            start = time.time()
+            entry = {
+                "pool": _create_pool(config),
+                "password": digest,
+                "created": time.time(),
+                "last_used": time.time(),
+                "acquired": 0,
+                "errors": 0,
+            }
+            _pools[key] = entry
+            print(f"Pool Oracle créé pour {key[3]}@{key[0]}:{key[1]}/{key[2]} en {time.time() - start:.2f}s")
+
+        entry["last_used"] = time.time()
+        return entry["pool"]
+
+
+@contextmanager
+def acquire(config: dict):
+    """
+    Emprunte une connexion au pool de la cible et la rend à la sortie.
+    La connexion est vérifiée (ping) avant d'être confiée à l'appelant ;
+    si elle est morte, le pool est recréé une fois.
+    """
+    key = _pool_key(config)
+    pool = get_pool(config)
+    try:
+        conn = pool.acquire()
+    except oracledb.Error as e:
+        if _timed_out(e):
+            raise
+        conn = None
+    if conn is not None:
+        try:
+            conn.ping()
+        except oracledb.Error:
+            try:
+                pool.drop(conn)
+            except oracledb.Error:
+                pass
+            conn = None
+
+    if conn is None:
+        # Pool invalide (redémarrage de la base, réseau coupé...) : on repart de zéro.
+        # Seulement s'il est encore celui du registre : un autre thread l'a peut-être déjà recréé.
+        with _lock:
+            entry = _pools.get(key)
+            if entry is not None and entry["pool"] is pool:
+                del _pools[key]
+                _retire(entry)
+        conn = get_pool(config).acquire()
+
+    with _lock:
+        entry = _pools.get(key)
+        if entry is not None:
+            entry["acquired"] += 1
+            entry["last_used"] = time.time()
+
+    try:
+        yield conn
+    except Exception:
+        with _lock:
+            if key in _pools:
+                _pools[key]["errors"] += 1
+        raise
+    finally:
+        try:
+            conn.close()  # Rend la connexion au pool
+        except oracledb.Error:
+            pass
+
+
+def evict_idle_pools(max_idle: float = MAX_IDLE_SECONDS) -> int:
+    """
+    Ferme les pools inutilisés depuis plus de `max_idle` secondes. Retourne le nombre fermé.
+    `last_used` date de l'emprunt : un pool dont une connexion est encore empruntée
+    (longue extraction en cours) n'est jamais fermé. Les pools remplacés sont fermés dès qu'ils sont libres.
+    """
+    _close_retired()
+    now = time.time()
+    with _lock:
+        stale = [key for key, entry in _pools.items()
+                 if now - entry["last_used"] > max_idle and _busy(entry["pool"]) == 0]
+        entries = [_pools.pop(key) for key in stale]
+    for entry in entries:
+        _close_entry(entry)
+    if entries:
+        print(f"{len(entries)} pool(s) Oracle inactif(s) fermé(s)")
+    return len(entries)
+
+
+def pool_stats() -> list:
+    """Statistiques de chaque pool du registre (sans informations sensibles)."""
+    now = time.time()
+    stats = []
+    with _lock:
+        for (host, port, service, user), entry in _pools.items():
+            pool = entry["pool"]
+            try:
+                opened, busy = pool.opened, pool.busy
+            except oracledb.Error:
+                opened, busy = 0, 0
+            stats.append({
+                "target": f"{user}@{host}:{port}/{service}",
+                "opened": opened,
+                "busy": busy,
+                "max": pool.max,
+                "acquired_total": entry["acquired"],
+                "errors": entry["errors"],
+                "age_sec": round(now - entry["created"], 1),
+                "idle_sec": round(now - entry["last_used"], 1),
+            })
+    return stats
+
+
+def close_all():
+    """Ferme tous les pools (arrêt du backend)."""
+    with _lock:
+        entries = list(_pools.values()) + _retired
+        _pools.clear()
+        _retired.clear()
+    for entry in entries:
+        _close_entry(entry)
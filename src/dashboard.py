@@ -1,3 +1,4 @@
+import json
 import streamlit as st
 import requests
 import oracledb
@@ -239,6 +240,21 @@ if "sidebar_messages" not in st.session_state:
 def navigate_to(page_name):
     st.session_state.navigation = page_name
 
+def wait_for_job(job_id, timeout=120):
+    """Suit un job d'extraction backend (/utils/jobs/{id}) jusqu'à sa fin, avec une barre de progression."""
+    progress = st.progress(0.0, text="Extraction des données Oracle...")
+    deadline = time.time() + timeout
+    job = {}
+    while time.time() < deadline:
+        job = requests.get(f"{API_URL}/utils/jobs/{job_id}", timeout=5).json()
+        done, total = job["progress"]["done"], max(job["progress"]["total"], 1)
+        progress.progress(done / total, text=f"Extraction : {done}/{total} étapes")
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.5)
+    progress.empty()
+    return job
+
 # -----------------------------------------------------------------------------
 # LOGIN PAGE (CENTERED)
 # -----------------------------------------------------------------------------
@@ -258,7 +274,7 @@ def login_page():
             user = st.text_input("User", "system")
             password = st.text_input("Password", type="password")
             st.markdown("**LLM Engine Configuration**")
-            llm_choice = st.selectbox("Model Provider", ["groq", "gemini"], index=0)
+            llm_choice = st.selectbox("Model Provider", ["groq", "gemini", "ollama", "openai"], index=0)
 
             with st.expander("Advanced Connection Settings"):
                 col_a, col_b = st.columns(2)
@@ -283,8 +299,13 @@ def login_page():
                         conn.close()
                         
                         # Config Backend
-                        response = requests.post(f"{API_URL}/connect-and-refresh", json=config, timeout=60)
+                        response = requests.post(f"{API_URL}/connect-and-refresh", json=config, timeout=10)
                         response.raise_for_status()
+                        job_id = response.json().get("job_id")
+                        if job_id:
+                            job = wait_for_job(job_id)
+                            if job.get("status") == "failed":
+                                st.warning(f"Extraction incomplète : {job.get('error')}")
                         
                         st.session_state.connected = True
                         st.session_state.db_config = config
@@ -308,12 +329,27 @@ def main_dashboard():
         # Actions Principales
         col_ref, col_log = st.columns(2)
         if col_ref.button("Refresh"):
-             with st.spinner(".."):
-                try:
-                    requests.post(f"{API_URL}/connect-and-refresh", json=st.session_state.db_config)
-                    st.toast("Données rafraîchies !", icon="✅")
-                except Exception:
-                    st.error("Refresh failed")
+            try:
+                # Extraction en arrière-plan : le dashboard reste utilisable pendant le rafraîchissement
+                resp = requests.post(f"{API_URL}/utils/refresh-data", json=st.session_state.db_config, timeout=10)
+                st.session_state.refresh_job = resp.json().get("job_id")
+                st.toast("Rafraîchissement lancé...", icon="🔄")
+            except Exception:
+                st.error("Refresh failed")
+
+        if st.session_state.get("refresh_job"):
+            try:
+                job = requests.get(f"{API_URL}/utils/jobs/{st.session_state.refresh_job}", timeout=5).json()
+                if job["status"] in ("queued", "running"):
+                    st.caption(f"Rafraîchissement : {job['progress']['done']}/{job['progress']['total']} étapes")
+                else:
+                    if job["status"] == "succeeded":
+                        st.toast("Données rafraîchies !", icon="✅")
+                    else:
+                        st.toast(f"Rafraîchissement {job['status']}", icon="⚠️")
+                    st.session_state.refresh_job = None
+            except Exception:
+                st.session_state.refresh_job = None
         
         if col_log.button("Logout"):
             st.session_state.clear()
@@ -602,9 +638,25 @@ def show_chatbot():
             message_placeholder.text("Processing...")
             
             try:
-                resp = requests.post(f"{API_URL}/chat/", json={"query": prompt})
-                ai_msg = resp.json().get("response", "Erreur réponse")
-                message_placeholder.markdown(ai_msg)
+                # Réponse en streaming (SSE) : affichage au fil des tokens
+                ai_msg = ""
+                event = None
+                with requests.post(f"{API_URL}/chat/stream", json={"query": prompt}, stream=True, timeout=(5, 120)) as resp:
+                    resp.raise_for_status()
+                    resp.encoding = "utf-8"
+                    for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data = json.loads(line[5:])
+                            if event == "error":
+                                ai_msg = data.get("error", "Erreur réponse")
+                            elif "delta" in data:
+                                ai_msg += data["delta"]
+                                message_placeholder.markdown(ai_msg + "▌")
+                        elif not line:
+                            event = None
+                message_placeholder.markdown(ai_msg or "Erreur réponse")
                 st.session_state.messages.append({"role": "assistant", "content": ai_msg})
             except Exception:
                 message_placeholder.error("Service temporarily unavailable.")
@@ -1,15 +1,287 @@
-import oracledb
 import pandas as pd
-from sqlalchemy import create_engine
 import os
+import json
+import time
+import hashlib
+import threading
+import oracledb
+from concurrent.futures import ThreadPoolExecutor
+from src.connection_pool import acquire, evict_idle_pools, POOL_MAX
+from src import snapshot_store
+from src.sql_sampler import get_sampler
 
 # Création du dossier data si nécessaire (au démarrage du backend)
 os.makedirs('data', exist_ok=True)
 
-def extract_data(config: dict) -> str:
+# High-water mark du journal d'audit local (snapshot_store "audit_trail", alimenté en ajout)
+AUDIT_STATE = 'data/audit_hwm.json'
+
+# Unified audit absent ou inaccessible : vue inexistante (ORA-00942), privilège manquant (ORA-01031).
+# Toute autre erreur (dont ORA-01013 / DPI-1080 d'un job annulé) fait échouer l'étape.
+AUDIT_UNAVAILABLE_CODES = {"ORA-00942", "ORA-01031"}
+
+# Taille des lots de fetch (arraysize/prefetchrows) et d'écriture des snapshots
+FETCH_ARRAYSIZE = 5000
+
+# Durées de la dernière exécution de chaque requête (exposées via /utils/extraction-stats)
+last_run = {}
+
+def _stream_sql(conn, sql: str, params: dict = None, chunk_size: int = FETCH_ARRAYSIZE):
+    """
+    Exécute une requête et produit le résultat par lots de `chunk_size` lignes (DataFrames,
+    colonnes en minuscules). arraysize/prefetchrows sont alignés sur la taille du lot :
+    un aller-retour réseau par lot, et jamais plus d'un lot en mémoire.
+    """
+    with conn.cursor() as cursor:
+        cursor.arraysize = chunk_size
+        cursor.prefetchrows = chunk_size + 1  # +1 : évite un aller-retour pour détecter la fin
+        cursor.execute(sql, params or {})
+        columns = [desc[0].lower() for desc in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=columns)
+
+# -----------------------------------------------------------------------------
+# ETAPES D'EXTRACTION (une requête = une étape = une connexion du pool)
+# -----------------------------------------------------------------------------
+def _extract_users(conn, namespace: str = None) -> dict:
+    return snapshot_store.write_chunks("users", _stream_sql(conn, """
+        SELECT username, account_status, profile, created
+        FROM dba_users
+        WHERE account_status IN ('OPEN', 'LOCKED', 'EXPIRED')
+    """), namespace=namespace)
+
+def _extract_roles(conn, namespace: str = None) -> dict:
+    return snapshot_store.write_chunks("roles", _stream_sql(conn, """
+        SELECT grantee, granted_role
+        FROM dba_role_privs
+        WHERE grantee IN (SELECT username FROM dba_users)
+    """), namespace=namespace)
+
+def _extract_privs(conn, namespace: str = None) -> dict:
+    return snapshot_store.write_chunks("privs", _stream_sql(conn, """
+        SELECT grantee, privilege
+        FROM dba_sys_privs
+    """), namespace=namespace)
+
+def _audit_state_path(namespace: str = None) -> str:
+    if namespace is None:
+        return AUDIT_STATE
+    return os.path.join(snapshot_store.base_dir(namespace), "audit_hwm.json")
+
+def _load_audit_state(namespace: str = None) -> dict:
+    try:
+        with open(_audit_state_path(namespace), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"hwm": None, "hwm_keys": []}
+
+def _save_audit_state(state: dict, namespace: str = None):
+    # Ecriture atomique : un crash ne doit jamais laisser un high-water mark corrompu
+    path = _audit_state_path(namespace)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def _audit_row_key(row: tuple) -> str:
+    return hashlib.sha1(repr(row).encode("utf-8")).hexdigest()
+
+def _extract_audit(conn, namespace: str = None) -> dict:
+    """
+    Extraction incrémentale de unified_audit_trail.
+    Seuls les événements postérieurs au dernier event_timestamp vu (high-water mark) sont lus,
+    puis ajoutés au journal local "audit_trail" (un segment par lot). Les lignes déjà vues
+    exactement au timestamp du HWM sont écartées (on relit avec >= pour ne rien perdre des
+    événements de la même microseconde).
+    """
+    state = _load_audit_state(namespace)
+    if state["hwm"]:
+        where = "event_timestamp >= TO_TIMESTAMP(:hwm, 'YYYY-MM-DD\"T\"HH24:MI:SS.FF6')"
+        params = {"hwm": state["hwm"]}
+    else:
+        # Premier passage : on se limite aux 7 derniers jours
+        where = "event_timestamp > SYSDATE - 7"
+        params = {}
+
+    seen_at_hwm = set(state.get("hwm_keys", []))
+    total = 0
+    try:
+        chunks = _stream_sql(conn, f"""
+            SELECT event_timestamp, dbusername, action_name, object_schema, object_name, sql_text
+            FROM unified_audit_trail
+            WHERE {where}
+            ORDER BY event_timestamp
+        """, params)
+        for batch_df in chunks:
+            rows = list(batch_df.itertuples(index=False, name=None))
+            keep = [_audit_row_key(r) not in seen_at_hwm for r in rows]
+            batch_df = batch_df[keep]
+            rows = [r for r, k in zip(rows, keep) if k]
+            if not rows:
+                continue
+
+            snapshot_store.append_rows("audit_trail", batch_df, namespace=namespace)
+
+            # Le HWM avance après chaque lot écrit : une extraction interrompue reprend sans doublon
+            last_ts = rows[-1][0]
+            hwm = last_ts.strftime("%Y-%m-%dT%H:%M:%S.%f")
+            keys = seen_at_hwm if state["hwm"] == hwm else set()
+            keys.update(_audit_row_key(r) for r in rows if r[0] == last_ts)
+            state = {"hwm": hwm, "hwm_keys": sorted(keys)}
+            seen_at_hwm = keys
+            _save_audit_state(state, namespace)
+            total += len(rows)
+
+        print(f"{total} nouveaux logs d'audit extraits")
+    except oracledb.DatabaseError as e:
+        error = e.args[0] if e.args else None
+        if getattr(error, "full_code", None) not in AUDIT_UNAVAILABLE_CODES:
+            raise
+        print("Unified audit non activé ou inaccessible :", e)
+    return {"rows": total, "changed": total > 0}
+
+def _extract_slow_queries(conn, namespace: str = None) -> dict:
+    result = snapshot_store.write_chunks("slow_queries", _stream_sql(conn, """
+        SELECT sql_id, sql_text, executions, elapsed_time/1000000 AS elapsed_sec,
+               disk_reads, buffer_gets
+        FROM v$sql
+        WHERE parsing_schema_name NOT IN ('SYS', 'SYSTEM')
+          AND executions > 0
+        ORDER BY elapsed_time DESC
+        FETCH FIRST 20 ROWS ONLY
+    """), namespace=namespace)
+    print(f"{result['rows']} requêtes lentes extraites")
+    return result
+
+def _sample_sql_deltas(conn, namespace: str = None) -> dict:
+    # Alimente le buffer circulaire des deltas V$SQL (classement par charge récente, en mémoire)
+    return {"rows": get_sampler(namespace or "default").sample(conn)}
+
+STAGES = {
+    "users": _extract_users,
+    "roles": _extract_roles,
+    "privs": _extract_privs,
+    "audit": _extract_audit,
+    "slow_queries": _extract_slow_queries,
+    "sql_deltas": _sample_sql_deltas,
+}
+
+# Dataset du snapshot_store alimenté par chaque étape (même nom sauf exception)
+STAGE_DATASETS = {"audit": "audit_trail"}
+
+class ExtractionCancelled(RuntimeError):
+    """Levée quand une extraction est annulée (job annulé via l'API)."""
+
+# Une étape déjà en cours sur une cible (collecteur, rafraîchissement manuel) n'est jamais relancée en parallèle
+_stage_locks = {}
+_stage_locks_guard = threading.Lock()
+
+def _stage_lock(namespace: str, name: str) -> threading.Lock:
+    with _stage_locks_guard:
+        return _stage_locks.setdefault((namespace, name), threading.Lock())
+
+def _run_stage(config: dict, name: str, namespace: str = None, job=None) -> dict:
+    """
+    Exécute une étape sur sa propre connexion empruntée au pool et mesure sa durée.
+    `job` (optionnel, voir src/jobs.py) reçoit la progression et peut annuler l'étape.
+    """
+    if job is not None and job.cancelled:
+        error = ExtractionCancelled(f"Etape {name} annulée")
+        job.stage_failed(name, error)
+        raise error
+
+    lock = _stage_lock(namespace, name)
+    if not lock.acquire(blocking=False):
+        print(f"Etape {name} déjà en cours, ignorée")
+        result = {"rows": 0, "duration_sec": 0.0, "rows_per_sec": None, "skipped": True}
+        if job is not None:
+            job.stage_finished(name, result)
+        return result
+    try:
+        start = time.time()
+        with acquire(config) as conn:
+            if job is not None:
+                job.stage_started(name, conn)
+            outcome = STAGES[name](conn, namespace)
+        duration = time.time() - start
+    except Exception as e:
+        if job is not None:
+            job.stage_failed(name, e)
+        raise
+    finally:
+        lock.release()
+
+    rows = outcome["rows"]
+    result = {
+        "rows": rows,
+        "duration_sec": round(duration, 3),
+        "rows_per_sec": round(rows / duration, 1) if duration > 0 else None,
+    }
+    if "changed" in outcome:
+        result["changed"] = outcome["changed"]
+    if job is not None:
+        job.stage_finished(name, result)
+    return result
+
+def run_extraction(config: dict, stages: list = None, namespace: str = None, job=None) -> dict:
+    """
+    Exécute les étapes demandées (toutes par défaut) et retourne le bilan de l'extraction.
+    Lève une exception si une étape échoue. `namespace` isole les snapshots d'une cible
+    du mode flotte (data/fleet/<cible>/) ; None = base principale (data/snapshots/).
+
+    Les connexions sont empruntées au registre de pools partagé (src/connection_pool.py) :
+    les rafraîchissements successifs sur la même cible ne refont pas le handshake TCP + auth.
+    Les requêtes sont lancées en parallèle (au plus `pool_max` connexions à la fois),
+    la durée d'un rafraîchissement est donc celle de la requête la plus lente.
+    """
+    global last_run
+    names = list(stages or STAGES)
+    unknown = [name for name in names if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Etapes inconnues : {', '.join(unknown)}")
+
+    # Libère au passage les pools des cibles qui ne sont plus rafraîchies
+    evict_idle_pools()
+
+    start = time.time()
+    workers = min(len(names), int(config.get("pool_max", POOL_MAX)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract") as executor:
+        futures = {name: executor.submit(_run_stage, config, name, namespace, job) for name in names}
+        timings = {name: future.result() for name, future in futures.items()}
+    total = time.time() - start
+
+    # Manifeste des changements : les analyseurs ne recalculent que si leurs entrées ont changé
+    changed = [STAGE_DATASETS.get(n, n) for n, t in timings.items() if t.get("changed") is True]
+    unchanged = [STAGE_DATASETS.get(n, n) for n, t in timings.items() if t.get("changed") is False]
+    snapshot_store.record_refresh(changed, unchanged, namespace)
+
+    run = {
+        "target": f"{config['user']}@{config['host']}:{config['port']}/{config['service']}",
+        "finished_at": time.time(),
+        "total_sec": round(total, 3),
+        "stages": timings,
+        "changed": changed,
+    }
+    detail = ", ".join(
+        f"{name} {t['duration_sec']:.2f}s ({t['rows_per_sec'] or 0:.0f} lignes/s)" for name, t in timings.items()
+    )
+    print(f"Extraction terminée en {total:.2f}s ({detail}) ! Snapshots sauvegardés dans {snapshot_store.base_dir(namespace)}/")
+    if namespace is None:
+        # Fusion par étape : les extractions partielles (sql_deltas du collecteur, toutes les 60 s)
+        # n'effacent pas les durées des autres étapes ; un changement de cible repart de zéro
+        stages = dict(last_run.get("stages", {})) if last_run.get("target") == run["target"] else {}
+        stages.update({name: dict(t, finished_at=run["finished_at"]) for name, t in timings.items()})
+        last_run = dict(run, stages=stages)
+    return run
+
+def extract_data(config: dict, stages: list = None) -> str:
     """
     Extrait les données Oracle en utilisant la configuration fournie par l'utilisateur.
-    
+
     config = {
         "host": "localhost",
         "port": 1521,
@@ -17,86 +289,12 @@ def extract_data(config: dict) -> str:
         "user": "imane",
         "password": "MyPassword123"
     }
-    
+
     Retourne un message de succès ou d'erreur.
     """
     try:
-        host = config["host"]
-        port = int(config["port"])
-        service = config["service"]
-        user = config["user"]
-        password = config["password"]
-
-        # Construction du DSN
-        dsn = oracledb.makedsn(host=host, port=port, service_name=service)
-
-        # Chaîne de connexion SQLAlchemy
-        connection_string = f"oracle+oracledb://{user}:{password}@{dsn}"
-
-        # Création de l'engine
-        engine = create_engine(
-            connection_string,
-            thick_mode=False,  # Mode thin
-            pool_size=5,
-            max_overflow=10,
-            echo=False
-        )
-
-        print(f"Connexion réussie à {user}@{host}:{port}/{service} via SQLAlchemy !")
-
-        # 1. Utilisateurs
-        users_df = pd.read_sql("""
-            SELECT username, account_status, profile, created
-            FROM dba_users
-            WHERE account_status IN ('OPEN', 'LOCKED', 'EXPIRED')
-        """, engine)
-        users_df.to_csv('data/users.csv', index=False)
-
-        # 2. Rôles accordés
-        roles_df = pd.read_sql("""
-            SELECT grantee, granted_role
-            FROM dba_role_privs
-            WHERE grantee IN (SELECT username FROM dba_users)
-        """, engine)
-        roles_df.to_csv('data/roles.csv', index=False)
-
-        # 3. Privilèges système
-        privs_df = pd.read_sql("""
-            SELECT grantee, privilege
-            FROM dba_sys_privs
-        """, engine)
-        privs_df.to_csv('data/privs.csv', index=False)
-
-        # 4. Logs d'audit unifiés
-        try:
-            audit_df = pd.read_sql("""
-                SELECT event_timestamp, dbusername, action_name, object_schema, object_name, sql_text
-                FROM unified_audit_trail
-                WHERE event_timestamp > SYSDATE - 7
-                ORDER BY event_timestamp DESC
-                FETCH FIRST 200 ROWS ONLY
-            """, engine)
-            audit_df.to_json('data/synthetic_logs.json', orient='records', date_format='iso')
-            print(f"{len(audit_df)} logs d'audit extraits")
-        except Exception as e:
-            print("Unified audit non activé ou vide :", e)
-            pd.DataFrame().to_json('data/synthetic_logs.json', orient='records')
-
-        # 5. Requêtes lentes
-        slow_queries = pd.read_sql("""
-            SELECT sql_id, sql_text, executions, elapsed_time/1000000 AS elapsed_sec,
-                   disk_reads, buffer_gets
-            FROM v$sql
-            WHERE parsing_schema_name NOT IN ('SYS', 'SYSTEM')
-              AND executions > 0
-            ORDER BY elapsed_time DESC
-            FETCH FIRST 20 ROWS ONLY
-        """, engine)
-        slow_queries.to_csv('data/slow_queries.csv', index=False)
-        print(f"{len(slow_queries)} requêtes lentes extraites")
-
-        print("Extraction terminée ! Données sauvegardées dans data/")
-        return f"Succès : données extraites de {user}@{host}/{service}"
+        run = run_extraction(config, stages)
+        return f"Succès : données extraites de {config['user']}@{config['host']}/{config['service']} en {run['total_sec']:.2f}s"
 
     except Exception as e:
         error_msg = f"Erreur lors de l'extraction : {str(e)}"
@@ -113,4 +311,4 @@ if __name__ == "__main__":
         "user": "system",
         "password": "MyPassword123"
     }
-    print(extract_data(test_config))
\ No newline at end of file
+    print(extract_data(test_config))
@@ -0,0 +1,186 @@
+# backend/src/fleet.py - Mode flotte : extraction et analyse de plusieurs bases Oracle en parallèle
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import yaml
+from src.data_extractor import run_extraction
+from src.sql_sampler import get_sampler
+from src import snapshot_store
+from src.security_audit import security_metrics
+
+FLEET_FILE = os.getenv("FLEET_FILE", "data/fleet.yaml")
+
+# Nombre de bases extraites simultanément (chaque base ouvre en plus ses propres connexions en parallèle)
+DEFAULT_MAX_PARALLEL = 8
+
+# Dernier résultat d'extraction par cible
+last_results = {}
+
+# Fichier déjà analysé : chemin -> (date de modification, flotte) ; erreur de la dernière lecture
+_loaded = {}
+load_error = None
+
+# Exemple de data/fleet.yaml :
+#
+# max_parallel: 8
+# defaults:
+#   port: 1521
+#   user: dbaai_monitor
+#   password_env: FLEET_PASSWORD      # Mot de passe lu dans l'environnement, jamais dans le fichier
+# targets:
+#   - name: sales_pdb
+#     host: db01.local
+#     service: salespdb
+#   - name: hr_pdb
+#     host: db02.local
+#     service: hrpdb
+#     user: hr_monitor
+#     password_env: HR_MONITOR_PASSWORD
+
+
+def load_fleet(path: str = FLEET_FILE) -> dict:
+    """
+    Configuration de la flotte : {"max_parallel": int, "targets": {nom: config}}.
+    Relue seulement quand le fichier change ; un fichier invalide est signalé et traité comme une flotte vide.
+    """
+    global load_error
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        load_error = None
+        return {"max_parallel": DEFAULT_MAX_PARALLEL, "targets": {}}
+
+    cached = _loaded.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        fleet = _parse_fleet(path)
+        load_error = None
+    except Exception as e:
+        print(f"⚠️ {path} invalide, mode flotte désactivé : {e}")
+        fleet = {"max_parallel": DEFAULT_MAX_PARALLEL, "targets": {}}
+        load_error = str(e)
+    _loaded[path] = (mtime, fleet)
+    return fleet
+
+
+def _parse_fleet(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+
+    defaults = raw.get("defaults", {})
+    targets = {}
+    for entry in raw.get("targets", []):
+        config = {**defaults, **entry}
+        name = str(config.pop("name", ""))
+        # Le nom sert de dossier de snapshots : pas de séparateurs de chemin
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", name):
+            raise ValueError(f"Nom de cible invalide dans {path} : '{name}'")
+        password_env = config.pop("password_env", None)
+        if "password" not in config and password_env:
+            config["password"] = os.getenv(password_env, "")
+        targets[name] = config
+
+    return {"max_parallel": int(raw.get("max_parallel", DEFAULT_MAX_PARALLEL)), "targets": targets}
+
+
+def is_enabled() -> bool:
+    return bool(load_fleet()["targets"])
+
+
+def _extract_target(name: str, config: dict, stages: list = None) -> dict:
+    start = time.time()
+    try:
+        run = run_extraction(config, stages, namespace=name)
+        result = {"status": "success", "total_sec": run["total_sec"], "stages": run["stages"]}
+    except Exception as e:
+        result = {"status": "error", "error": str(e), "total_sec": round(time.time() - start, 3)}
+    result["finished_at"] = time.time()
+    last_results[name] = result
+    return result
+
+
+def refresh_fleet(stages: list = None, targets: list = None) -> dict:
+    """
+    Extrait toutes les cibles de la flotte (ou celles de `targets`) en parallèle,
+    au plus `max_parallel` bases à la fois. Une cible en échec n'interrompt pas les autres.
+    """
+    fleet = load_fleet()
+    selected = {name: cfg for name, cfg in fleet["targets"].items() if not targets or name in targets}
+    if not selected:
+        return {"targets": {}, "total_sec": 0.0}
+
+    start = time.time()
+    workers = min(len(selected), fleet["max_parallel"])
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet") as executor:
+        futures = {name: executor.submit(_extract_target, name, cfg, stages) for name, cfg in selected.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    total = time.time() - start
+    failed = sum(1 for r in results.values() if r["status"] != "success")
+    print(f"Flotte rafraîchie en {total:.2f}s : {len(results) - failed}/{len(results)} cibles OK")
+    return {"targets": results, "total_sec": round(total, 3)}
+
+
+def fleet_status() -> dict:
+    fleet = load_fleet()
+    return {
+        "max_parallel": fleet["max_parallel"],
+        "error": load_error,
+        "targets": {
+            name: {
+                "target": f"{cfg.get('user')}@{cfg.get('host')}:{cfg.get('port')}/{cfg.get('service')}",
+                "last_result": last_results.get(name),
+            }
+            for name, cfg in fleet["targets"].items()
+        },
+    }
+
+
+def top_slow_sql(limit: int = 10, window: int = None, metric: str = "elapsed_sec") -> list:
+    """
+    Requêtes les plus lentes sur l'ensemble de la flotte.
+    Avec `window` : classement par charge récente (deltas V$SQL), sinon snapshots cumulés.
+    """
+    frames = []
+    for name in load_fleet()["targets"]:
+        if window:
+            queries = get_sampler(name).top(window, metric=metric, limit=limit)
+            df = pd.DataFrame(queries)
+        else:
+            try:
+                df = snapshot_store.read_table(
+                    "slow_queries",
+                    columns=["sql_id", "sql_text", "executions", "elapsed_sec", "disk_reads", "buffer_gets"],
+                    namespace=name,
+                )
+            except (OSError, ValueError):
+                continue
+        if not df.empty:
+            df.insert(0, "target", name)
+            frames.append(df)
+
+    if not frames:
+        return []
+    merged = pd.concat(frames, ignore_index=True)
+    sort_key = metric if metric in merged.columns else "elapsed_sec"
+    return merged.sort_values(sort_key, ascending=False).head(limit).to_dict(orient="records")
+
+
+def security_summary() -> list:
+    """Score de sécurité (sans LLM) de chaque cible, du plus faible au plus élevé."""
+    summary = []
+    for name in load_fleet()["targets"]:
+        try:
+            users_df = snapshot_store.read_table("users", columns=["username", "account_status"], namespace=name)
+            roles_df = snapshot_store.read_table("roles", columns=["grantee", "granted_role"], namespace=name)
+            privs_df = snapshot_store.read_table("privs", columns=["grantee", "privilege"], namespace=name)
+        except (OSError, ValueError):
+            summary.append({"target": name, "error": "Aucun snapshot, lancez un rafraîchissement"})
+            continue
+        summary.append({"target": name, **security_metrics(users_df, roles_df, privs_df)})
+
+    return sorted(summary, key=lambda item: item.get("score", 101))
@@ -0,0 +1,359 @@
+# backend/src/ingest.py - Ingestion de documentation (PDF, Markdown, HTML, texte) dans la base RAG
+#
+# API :  POST /ingest {"paths": ["oracle/"]} (chemins relatifs à INGEST_ROOT), puis GET /ingest/status
+# CLI :  python -m src.ingest docs/oracle --workers 4
+#        Backend lancé : la CLI passe par son API (ChromaDB ne supporte pas deux processus sur le même
+#        dossier, et les caches / l'index NumPy du backend doivent être mis à jour). Sinon, ingestion
+#        directe hors ligne ; --offline la force (à n'utiliser que backend arrêté).
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+import numpy as np
+from src.rag_setup import INDEX_BATCH, MODEL_NAME, content_id, rag
+
+# Lecture des PDF optionnelle (pip install pypdf)
+try:
+    from pypdf import PdfReader
+    HAS_PYPDF = True
+except ImportError:
+    HAS_PYPDF = False
+
+EXTENSIONS = {
+    ".pdf": "pdf",
+    ".md": "markdown", ".markdown": "markdown",
+    ".html": "html", ".htm": "html",
+    ".txt": "text", ".rst": "text",
+}
+
+# Dossier autorisé pour l'API (la CLI hors ligne accepte n'importe quel chemin)
+INGEST_ROOT = os.getenv("INGEST_ROOT", "docs")
+API_URL = os.getenv("INGEST_API_URL", "http://localhost:8000")
+
+# Découpage en mots avec recouvrement ; all-MiniLM-L6-v2 tronque au-delà de 256 tokens (~180 mots)
+CHUNK_WORDS = int(os.getenv("INGEST_CHUNK_WORDS", 150))
+CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", 30))
+
+EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 64))
+WORKERS = int(os.getenv("INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+# En dessous, charger le modèle dans chaque processus coûte plus cher que d'encoder sur place
+MIN_PARALLEL_CHUNKS = 512
+
+
+class _HTMLText(HTMLParser):
+    """Texte visible d'une page HTML (sans script/style), un saut de ligne par bloc."""
+
+    BLOCKS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "section", "article"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = None
+        self._skip = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._skip = max(0, self._skip - 1)
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = (self.title or "") + data.strip()
+        elif not self._skip:
+            self.parts.append(data)
+
+
+def _read_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def read_document(path: str) -> dict:
+    """Fichier -> {"type", "title", "pages": [(n° de page ou None, texte)]}."""
+    kind = EXTENSIONS[os.path.splitext(path)[1].lower()]
+    title = os.path.basename(path)
+
+    if kind == "pdf":
+        if not HAS_PYPDF:
+            raise RuntimeError("pypdf non installé (pip install pypdf)")
+        reader = PdfReader(path)
+        if reader.metadata and reader.metadata.title:
+            title = reader.metadata.title
+        pages = [(i + 1, page.extract_text() or "") for i, page in enumerate(reader.pages)]
+        return {"type": kind, "title": title, "pages": pages}
+
+    text = _read_file(path)
+    if kind == "html":
+        parser = _HTMLText()
+        parser.feed(text)
+        text = "".join(parser.parts)
+        title = parser.title or title
+    elif kind == "markdown":
+        heading = re.search(r"^#\s+(.+)$", text, re.MULTILINE)
+        if heading:
+            title = heading.group(1).strip()
+        text = re.sub(r"!?\[([^\]]*)\]\([^)]*\)", r"\1", text)     # Liens et images : texte seul
+        text = re.sub(r"^```.*$", "", text, flags=re.MULTILINE)
+    return {"type": kind, "title": title, "pages": [(None, text)]}
+
+
+def chunk_text(text: str, size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> list:
+    """Fenêtres de `size` mots, chacune reprenant les `overlap` derniers mots de la précédente."""
+    words = text.split()
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    step = max(1, size - overlap)
+    return [" ".join(words[i:i + size]) for i in range(0, len(words) - overlap, step)]
+
+
+def collect_files(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if os.path.splitext(name)[1].lower() in EXTENSIONS)
+        elif os.path.splitext(path)[1].lower() in EXTENSIONS:
+            files.append(path)
+    return sorted(dict.fromkeys(os.path.abspath(f) for f in files))
+
+
+# Processus d'encodage : chaque worker charge le modèle une fois (initializer), puis encode des lots
+_worker_model = None
+
+
+def _init_worker(threads: int):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)  # Pas de sur-souscription des cœurs entre workers
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(MODEL_NAME)
+
+
+def _embed_batch(texts: list):
+    return _worker_model.encode(texts, batch_size=EMBED_BATCH)
+
+
+def embed_parallel(texts: list, workers: int = WORKERS) -> np.ndarray:
+    """Encode `texts` par lots de EMBED_BATCH répartis sur `workers` processus (ordre conservé)."""
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    if workers <= 1 or len(texts) < MIN_PARALLEL_CHUNKS:
+        return np.asarray(rag.model.encode(texts, batch_size=EMBED_BATCH))
+    batches = [texts[i:i + EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # "spawn" : pas de fork d'un processus où torch a déjà démarré ses threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(threads,)) as pool:
+        return np.vstack(list(pool.map(_embed_batch, batches)))
+
+
+def indexed_files() -> set:
+    """Chemins des fichiers déjà présents dans l'index (sources "file:<chemin>")."""
+    files = set()
+    for offset in range(0, rag.collection.count(), INDEX_BATCH):
+        page = rag.collection.get(include=["metadatas"], limit=INDEX_BATCH, offset=offset)
+        files.update(meta["source"][5:] for meta in page["metadatas"]
+                     if str(meta.get("source", "")).startswith("file:"))
+    return files
+
+
+def _removed_files(paths: list, seen: set) -> list:
+    # Fichiers indexés sous les dossiers (ou aux chemins) ingérés, qui n'existent plus sur le disque
+    roots = [os.path.abspath(path) for path in paths]
+    removed = []
+    for path in indexed_files() - seen:
+        under_root = any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+        if under_root and not os.path.exists(path):
+            removed.append(path)
+    return sorted(removed)
+
+
+def ingest(paths: list, workers: int = WORKERS, progress=None) -> dict:
+    """
+    Lit et découpe les fichiers, encode en parallèle les seuls morceaux absents de l'index,
+    puis synchronise chaque fichier (source "file:<chemin>") avec ChromaDB via rag.index().
+    Les fichiers supprimés depuis la dernière ingestion des mêmes dossiers sont retirés de l'index.
+    Retourne un rapport : volumes, durée de chaque phase et débit.
+    """
+    progress = progress or (lambda phase: None)
+    if not rag.wait():
+        raise RuntimeError(f"Service RAG indisponible ({rag.error or 'chromadb / sentence_transformers manquants'})")
+
+    start = time.perf_counter()
+    progress("lecture")
+    documents, errors = {}, {}
+    pages = chars = 0
+    files = collect_files(paths)
+    for path in files:
+        try:
+            doc = read_document(path)
+        except Exception as e:
+            errors[path] = str(e)
+            continue
+        texts, metadatas = [], []
+        for page, text in doc["pages"]:
+            chars += len(text)
+            for i, chunk in enumerate(chunk_text(text)):
+                meta = {"path": path, "title": doc["title"], "type": doc["type"], "chunk": i}
+                if page is not None:
+                    meta["page"] = page
+                texts.append(chunk)
+                metadatas.append(meta)
+        pages += len(doc["pages"])
+        documents[f"file:{path}"] = (texts, metadatas)
+    read_sec = time.perf_counter() - start
+
+    # Seuls les morceaux nouveaux ou modifiés sont encodés (même clé que index_documents)
+    progress("encodage")
+    pending = {}
+    for source, (texts, _) in documents.items():
+        existing = set(rag.collection.get(where={"source": source}, include=[])["ids"])
+        for text in texts:
+            doc_id = content_id(text, source)
+            if doc_id not in existing:
+                pending[doc_id] = text
+    embed_start = time.perf_counter()
+    vectors = dict(zip(pending, embed_parallel(list(pending.values()), workers)))
+    embed_sec = time.perf_counter() - embed_start
+
+    progress("indexation")
+    index_start = time.perf_counter()
+    added = deleted = unchanged = 0
+    for source, (texts, metadatas) in documents.items():
+        report = rag.index(texts, source, metadatas, refresh=False,
+                           embed=lambda batch, source=source: [vectors[content_id(t, source)] for t in batch])
+        added += report["added"]
+        deleted += report["deleted"]
+        unchanged += report["unchanged"]
+    removed_files = _removed_files(paths, set(files))
+    for path in removed_files:
+        deleted += rag.index([], f"file:{path}", refresh=False)["deleted"]
+    # Un seul rafraîchissement du backend (reconstruction de la matrice NumPy) pour tout le lot
+    rag.refresh_if_stale()
+    index_sec = time.perf_counter() - index_start
+
+    total = time.perf_counter() - start
+    chunks = sum(len(texts) for texts, _ in documents.values())
+    return {
+        "files": len(documents),
+        "pages": pages,
+        "characters": chars,
+        "chunks": chunks,
+        "added": added,
+        "deleted": deleted,
+        "unchanged": unchanged,
+        "removed_files": removed_files,
+        "errors": errors,
+        "workers": workers if len(pending) >= MIN_PARALLEL_CHUNKS else 1,
+        "read_sec": round(read_sec, 3),
+        "embed_sec": round(embed_sec, 3),
+        "index_sec": round(index_sec, 3),
+        "total_sec": round(total, 3),
+        "embedded_chunks_per_sec": round(len(pending) / embed_sec, 1) if pending and embed_sec else None,
+        "pages_per_sec": round(pages / total, 1) if total else None,
+    }
+
+
+# Ingestion lancée depuis l'API : une seule à la fois, en arrière-plan
+status = {"state": "idle"}
+_running = threading.Lock()
+
+
+def start(paths: list, workers: int = WORKERS) -> bool:
+    """Lance ingest() dans un thread ; False si une ingestion est déjà en cours."""
+    global status
+    if not _running.acquire(blocking=False):
+        return False
+    status = {"state": "running", "phase": "attente du service RAG", "paths": paths, "started": time.time()}
+
+    def run():
+        global status
+        try:
+            report = ingest(paths, workers, progress=lambda phase: status.update(phase=phase))
+            status = {"state": "done", "paths": paths, "finished": time.time(), **report}
+        except Exception as e:
+            print(f"⚠️ Erreur d'ingestion : {e}")
+            status = {"state": "error", "paths": paths, "error": str(e), "finished": time.time()}
+        finally:
+            _running.release()
+
+    threading.Thread(target=run, name="rag-ingest", daemon=True).start()
+    return True
+
+
+def _api_running() -> bool:
+    import requests
+    try:
+        requests.get(f"{API_URL}/ingest/status", timeout=2)
+        return True
+    except requests.RequestException:
+        return False
+
+
+def ingest_via_api(paths: list, workers: int) -> dict:
+    """Délègue l'ingestion au backend lancé (POST /ingest) et attend son rapport."""
+    import requests
+    root = os.path.realpath(INGEST_ROOT)
+    relative = []
+    for path in paths:
+        rel = os.path.relpath(os.path.realpath(path), root)
+        if rel.startswith(".."):
+            raise SystemExit(f"❌ {path} est hors de {INGEST_ROOT} : déplacez-le sous INGEST_ROOT, "
+                             f"ou arrêtez le backend et relancez avec --offline")
+        relative.append(rel)
+
+    response = requests.post(f"{API_URL}/ingest/", json={"paths": relative, "workers": workers}, timeout=10)
+    if response.status_code >= 400:
+        raise SystemExit(f"❌ Ingestion refusée par le backend ({response.status_code}) : {response.text}")
+    phase = None
+    while True:
+        time.sleep(1)
+        current = requests.get(f"{API_URL}/ingest/status", timeout=10).json()
+        if current.get("state") == "running":
+            if current.get("phase") != phase:
+                phase = current.get("phase")
+                print(f"... {phase}")
+            continue
+        if current.get("state") == "error":
+            raise SystemExit(f"❌ Erreur d'ingestion : {current.get('error')}")
+        return current
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion de documentation dans la base RAG (ChromaDB)")
+    parser.add_argument("paths", nargs="+", help="Fichiers ou dossiers (.pdf, .md, .html, .txt)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Processus d'encodage")
+    parser.add_argument("--offline", action="store_true",
+                        help="Ingestion directe dans data/chroma_db, sans passer par le backend (backend arrêté)")
+    args = parser.parse_args()
+
+    if not args.offline and _api_running():
+        print(f"Backend détecté sur {API_URL} : ingestion via son API")
+        result = ingest_via_api(args.paths, args.workers)
+    else:
+        result = ingest(args.paths, args.workers, progress=lambda phase: print(f"... {phase}"))
+    for path, error in result.pop("errors").items():
+        print(f"⚠️ {path} : {error}")
+    print(f"✅ {result['files']} fichiers, {result['pages']} pages, {result['chunks']} morceaux "
+          f"(+{result['added']} / -{result['deleted']}) en {result['total_sec']}s")
+    print(json.dumps(result, indent=2, ensure_ascii=False))
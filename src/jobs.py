@@ -0,0 +1,147 @@
+# backend/src/jobs.py - Extractions en tâche de fond : identifiant, progression, annulation
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import oracledb
+from src.data_extractor import run_extraction, STAGES
+
+MAX_CONCURRENT_JOBS = 2
+MAX_JOBS_KEPT = 100      # Historique conservé en mémoire (les plus anciens sont oubliés)
+
+
+class ExtractionJob:
+    """Etat d'une extraction lancée en arrière-plan. Mis à jour par run_extraction (hooks stage_*)."""
+
+    def __init__(self, config: dict, stages: list = None, namespace: str = None, on_success=None):
+        self.id = uuid.uuid4().hex
+        self.config = config
+        self.namespace = namespace
+        self.on_success = on_success     # Appelé avec la config une fois l'extraction réussie
+        self.stage_names = list(stages or STAGES)
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.stages = {name: {"status": "pending"} for name in self.stage_names}
+        self._cancel = threading.Event()
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    # Hooks appelés depuis les threads d'extraction
+    def stage_started(self, name: str, conn):
+        with self._lock:
+            self._connections[name] = conn
+            self.stages[name] = {"status": "running", "started": time.time()}
+
+    def stage_finished(self, name: str, result: dict):
+        with self._lock:
+            self._connections.pop(name, None)
+            self.stages[name] = {"status": "skipped" if result.get("skipped") else "done", **result}
+
+    def stage_failed(self, name: str, error: Exception):
+        with self._lock:
+            self._connections.pop(name, None)
+            status = "cancelled" if self.cancelled else "error"
+            self.stages[name] = {"status": status, "error": str(error)}
+
+    def cancel(self) -> bool:
+        """Demande l'annulation : les étapes en attente ne démarrent pas, les requêtes en cours sont interrompues."""
+        if self.status not in ("queued", "running"):
+            return False
+        self._cancel.set()
+        with self._lock:
+            connections = list(self._connections.values())
+        for conn in connections:
+            try:
+                conn.cancel()  # Interrompt l'appel en cours côté serveur (ORA-01013)
+            except oracledb.Error:
+                pass
+        return True
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {name: dict(info) for name, info in self.stages.items()}
+        done = sum(1 for info in stages.values() if info["status"] in ("done", "skipped"))
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "target": f"{self.config.get('user')}@{self.config.get('host')}/{self.config.get('service')}",
+            "progress": {"done": done, "total": len(stages)},
+            "stages": stages,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = MAX_CONCURRENT_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, config: dict, stages: list = None, namespace: str = None, on_success=None) -> ExtractionJob:
+        """`on_success(config)` n'est appelé que si l'extraction aboutit (identifiants valides, étapes terminées)."""
+        unknown = [name for name in (stages or []) if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Etapes inconnues : {', '.join(unknown)}")
+
+        job = ExtractionJob(config, stages, namespace, on_success)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_JOBS_KEPT:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: ExtractionJob):
+        if job.cancelled:
+            job.status = "cancelled"
+            job.finished = time.time()
+            return
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = run_extraction(job.config, job.stage_names, job.namespace, job=job)
+            job.status = "cancelled" if job.cancelled else "succeeded"
+            if job.status == "succeeded" and job.on_success is not None:
+                try:
+                    job.on_success(job.config)
+                except Exception as e:
+                    print(f"Job {job.id[:8]} : erreur après extraction : {e}")
+        except Exception as e:
+            job.error = str(e)
+            job.status = "cancelled" if job.cancelled else "failed"
+        finally:
+            job.finished = time.time()
+            print(f"Job {job.id[:8]} terminé : {job.status}")
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager()
@@ -0,0 +1,297 @@
+# backend/src/llm_cache.py - Cache des réponses LLM : RAM bornée (LRU + TTL) + SQLite partagé
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 32 * 1024 * 1024))   # 32 Mo
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_TTL", 3600))                          # 1 h
+
+# Cache disque partagé entre workers uvicorn et redémarrages
+DB_PATH = os.getenv("LLM_CACHE_DB", "data/llm_cache.sqlite")
+DB_MAX_BYTES = int(os.getenv("LLM_CACHE_DB_MAX_BYTES", 256 * 1024 * 1024))     # 256 Mo
+DB_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DB_MAX_ENTRIES", 20000))
+DB_TTL = float(os.getenv("LLM_CACHE_DB_TTL", 24 * 3600))                       # 24 h
+EVICT_EVERY = 50       # Vérification des limites du cache disque toutes les N écritures
+
+
+def cache_key(provider: str, model: str, temperature: float, prompt: str) -> str:
+    """Clé stable d'une réponse : SHA-256 de (fournisseur, modèle, température, prompt)."""
+    payload = json.dumps([provider, model, temperature, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_size(key: str, value: str) -> int:
+    # Approximation de l'empreinte mémoire : taille UTF-8 de la clé + de la réponse
+    return len(key.encode("utf-8")) + len(value.encode("utf-8"))
+
+
+class ResponseCache:
+    """
+    Cache LRU thread-safe : les entrées expirent après `ttl` secondes et les moins
+    récemment utilisées sont évincées dès que `max_bytes` ou `max_entries` est dépassé.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()    # clé -> (réponse, expiration, taille)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires, size = entry
+            if expires < time.time():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str, ttl: float = None):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return  # Une réponse plus grosse que tout le cache n'est pas conservée
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.time() + (ttl or self.ttl), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._data) > self.max_entries:
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] >= time.time()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class PersistentCache:
+    """
+    Cache SQLite en mode WAL : lectures concurrentes sans blocage entre processus,
+    une connexion par thread. Eviction par TTL puis par dernier accès (LRU) au-delà
+    de `max_entries` / `max_bytes`.
+    """
+
+    def __init__(self, path: str = DB_PATH, max_bytes: int = DB_MAX_BYTES, max_entries: int = DB_MAX_ENTRIES,
+                 ttl: float = DB_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT response, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+            with conn:
+                conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache LLM disque indisponible : {e}")
+            return None
+
+    def set(self, key: str, value: str, ttl: float = None):
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, size, expires, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value.encode("utf-8")), now + (ttl or self.ttl), now),
+                )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self.evict()
+        except sqlite3.Error as e:
+            print(f"⚠️ Ecriture cache LLM disque impossible : {e}")
+
+    def evict(self):
+        """Supprime les entrées expirées, puis les moins récemment utilisées jusqu'à repasser sous les limites."""
+        conn = self._conn()
+        with conn:
+            removed = conn.execute("DELETE FROM llm_cache WHERE expires < ?", (time.time(),)).rowcount
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            if count > self.max_entries or total > self.max_bytes:
+                # On redescend à 90 % des limites pour ne pas évincer à chaque écriture
+                keep_entries = int(self.max_entries * 0.9)
+                keep_bytes = int(self.max_bytes * 0.9)
+                removed += conn.execute("""
+                    DELETE FROM llm_cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key,
+                                   ROW_NUMBER() OVER (ORDER BY last_access DESC) AS rank,
+                                   SUM(size) OVER (ORDER BY last_access DESC) AS running_bytes
+                            FROM llm_cache
+                        ) WHERE rank > ? OR running_bytes > ?
+                    )
+                """, (keep_entries, keep_bytes)).rowcount
+        self.evictions += removed
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        try:
+            count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        except sqlite3.Error:
+            count, total = None, None
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "max_entries": self.max_entries,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+class TieredCache:
+    """RAM d'abord, puis disque ; une réponse trouvée sur disque est remontée en RAM."""
+
+    def __init__(self, memory: ResponseCache, persistent: PersistentCache = None):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    # Versions pour la boucle asyncio : la partie SQLite (jusqu'à 5 s de busy_timeout) passe dans un thread
+    async def aget(self, key: str):
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = await asyncio.to_thread(self.persistent.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def aset(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await asyncio.to_thread(self.persistent.set, key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.persistent.stats() if self.persistent is not None else None,
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> TieredCache:
+    """
+    Cache unique du processus : il survit aux nouveaux LLMEngine créés par /connect-and-refresh,
+    et sa partie SQLite est partagée entre workers et redémarrages (LLM_CACHE_DB="" pour la désactiver).
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            persistent = None
+            if DB_PATH:
+                try:
+                    persistent = PersistentCache(DB_PATH)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Cache LLM disque désactivé : {e}")
+            _shared_cache = TieredCache(ResponseCache(), persistent)
+        return _shared_cache
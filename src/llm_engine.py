@@ -1,9 +1,23 @@
+import asyncio
+import contextlib
+import json
 import os
+import threading
 import time
 import yaml
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from typing import Optional
+from typing import AsyncIterator, Optional
+from src.llm_cache import get_shared_cache, cache_key
+from src import prompt_budget, llm_replay
+from src.rag_setup import is_degraded
+from src.prompt_budget import Section
+from src.single_flight import SingleFlight, AsyncSingleFlight
+from src.rate_limiter import (
+    get_limiter, parse_retry_after, RateLimitError, BACKGROUND, DEFAULT_RETRY_AFTER
+)
 
 # Gestion optionnelle de la lib Gemini
 try:
@@ -12,13 +26,97 @@ try:
 except ImportError:
     HAS_GEMINI_LIB = False
 
+# HTTP/2 optionnel (paquet h2) : multiplexe les appels parallèles sur une seule connexion TLS
+try:
+    import h2  # noqa: F401
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
 load_dotenv()
 
+# Pool de connexions HTTP vers les fournisseurs LLM (keep-alive : pas de handshake TLS à chaque appel)
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 10))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+USE_HTTP2 = HAS_HTTP2 and os.getenv("LLM_HTTP2", "true").lower() != "false"
+
+# Fournisseurs parlant l'API chat/completions d'OpenAI (même code d'appel)
+OPENAI_COMPATIBLE = ("groq", "openai")
+
+# Nouvel essai après un 429, seulement si le Retry-After demandé reste raisonnable
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 1))
+MAX_RETRY_WAIT = float(os.getenv("LLM_MAX_RETRY_WAIT", 30))
+
+# Préfixe des clés de prompts bâtis sur un contexte RAG générique (jamais lues ni écrites dans le cache)
+DEGRADED_KEY = "degraded:"
+
+# Clients partagés par tous les LLMEngine (set_llm en recrée un à chaque connexion)
+_session = None
+_async_client = None
+_async_loop = None
+_clients_lock = threading.Lock()
+
+# Appels en cours, indexés par clé de cache : des prompts identiques simultanés partagent un seul appel
+inflight = SingleFlight()
+ainflight = AsyncSingleFlight()
+
+
+def get_session() -> requests.Session:
+    """Session requests partagée pour les appels synchrones."""
+    global _session
+    with _clients_lock:
+        # Appelée depuis plusieurs threads (threadpool FastAPI, jobs) : une seule session créée
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Client httpx partagé, lié à la boucle asyncio courante (celle d'uvicorn)."""
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        if _async_client is None or _async_client.is_closed or _async_loop is not loop:
+            _async_client = httpx.AsyncClient(
+                http2=USE_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(30.0, connect=5.0),
+            )
+            _async_loop = loop
+        return _async_client
+
+
+async def close_http_clients():
+    """Ferme les connexions keep-alive (arrêt de l'application)."""
+    global _async_client, _session
+    with _clients_lock:
+        client, session = _async_client, _session
+        _async_client, _session = None, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+    if session is not None:
+        session.close()
+
 class LLMEngine:
     def __init__(self, provider: str = "groq", gemini_api_key: str = None, ollama_model: str = "phi3:mini"):
         self.provider = provider.lower()
         self.ollama_model = ollama_model
-        self.cache = {}
+        self.temperature = 0.3
+        self.model_name = None
+        self.api_key = None
+        self.api_url = None
+        self.client = None
+        self.max_retries = MAX_RETRIES
+        self.cache = get_shared_cache()
         
         # Chargement des prompts
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -37,7 +135,8 @@ class LLMEngine:
                 print("⚠️ Clé API Groq manquante. Vérifiez .env")
             else:
                 self.api_url = "https://api.groq.com/openai/v1/chat/completions"
-                self.model_name = "llama3-70b-8192" 
+                # Dernier modèle Llama 3.3 (Rapide et supporté)
+                self.model_name = "llama-3.3-70b-versatile"
                 print(f"✅ LLM Configuré : Groq ({self.model_name})")
 
         # 2. Configuration Gemini
@@ -56,44 +155,276 @@ class LLMEngine:
                     except Exception as e:
                         print(f"⚠️ Erreur init Gemini: {e}")
 
-    def generate(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None) -> str:
-        full_prompt = ""
+        # 3. Endpoint compatible OpenAI (stand-in local src/llm_standin.py, passerelle d'entreprise, vLLM...)
+        if self.provider == "openai":
+            base_url = os.getenv("LLM_OPENAI_BASE_URL")
+            if not base_url:
+                print("⚠️ LLM_OPENAI_BASE_URL manquant (ex. http://127.0.0.1:8001/v1).")
+            else:
+                self.api_url = base_url.rstrip("/") + "/chat/completions"
+                self.api_key = os.getenv("OPENAI_API_KEY", "standin")
+                self.model_name = os.getenv("LLM_OPENAI_MODEL", "dbaai-standin")
+                print(f"✅ LLM Configuré : OpenAI-compatible ({self.model_name} @ {base_url})")
+
+        # 4. Configuration Ollama (local)
+        if self.provider == "ollama":
+            self.api_url = os.getenv("OLLAMA_URL", "http://localhost:11434").rstrip("/") + "/api/generate"
+            print(f"✅ LLM Configuré : Ollama ({self.ollama_model})")
+
+    def _full_prompt(self, prompt: str, context: Optional[str], user_context: Optional[str]) -> str:
+        # Au-delà du budget de tokens du fournisseur, le contexte RAG est rogné en premier, puis le contexte utilisateur
+        sections = []
         if user_context:
-            full_prompt += f"Contexte utilisateur : {user_context}\n\n"
+            sections.append(Section("user_context", f"Contexte utilisateur : {user_context}", priority=1))
         if context:
-            full_prompt += f"Contexte technique : {context}\n\n"
-        full_prompt += prompt
-        
-        # Cache RAM simple
-        if full_prompt in self.cache:
-            return self.cache[full_prompt]
+            sections.append(Section("context", f"Contexte technique : {context}", priority=2))
+        sections.append(Section("prompt", prompt, priority=0))
+        full_prompt, _ = prompt_budget.build_prompt(sections, self.provider)
+        return full_prompt
 
-        start = time.time()
-        
+    def _cache_key(self, full_prompt: str) -> str:
+        key = cache_key(self.provider, self.model_name or self.ollama_model, self.temperature, full_prompt)
+        # Contexte RAG générique (préchauffage) : la clé sert encore au single-flight, jamais au cache
+        return DEGRADED_KEY + key if is_degraded(full_prompt) else key
+
+    @property
+    def available(self) -> bool:
+        """Fournisseur utilisable : clé API / client / URL correctement configurés (toujours vrai en rejeu)."""
+        if llm_replay.MODE == "replay":
+            return True
+        if self.provider == "gemini":
+            return self.client is not None
+        if self.provider in OPENAI_COMPATIBLE:
+            return bool(self.api_key and self.api_url)
+        return self.provider == "ollama" and bool(self.api_url)
+
+    @property
+    def token_budget(self) -> int:
+        """Tokens maximum par prompt pour ce fournisseur (voir prompt_budget.budget_for)."""
+        return prompt_budget.budget_for(self.provider)
+
+    def _cache_get(self, key: str):
+        # Rejeu : réponses simulées, jamais lues ni écrites dans le cache partagé (la clé ignore le mode).
+        # Enregistrement : chaque prompt doit atteindre le fournisseur pour être enregistré.
+        if llm_replay.MODE in ("replay", "record") or key.startswith(DEGRADED_KEY):
+            return None
+        return self.cache.get(key)
+
+    def _cache_set(self, key: str, value: str):
+        if llm_replay.MODE != "replay" and not key.startswith(DEGRADED_KEY):
+            self.cache.set(key, value)
+
+    async def _acache_get(self, key: str):
+        if llm_replay.MODE in ("replay", "record") or key.startswith(DEGRADED_KEY):
+            return None
+        return await self.cache.aget(key)
+
+    async def _acache_set(self, key: str, value: str):
+        if llm_replay.MODE != "replay" and not key.startswith(DEGRADED_KEY):
+            await self.cache.aset(key, value)
+
+    def cached(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None):
+        """Réponse déjà en cache pour ce prompt, sans appeler le fournisseur (None sinon)."""
+        return self._cache_get(self._cache_key(self._full_prompt(prompt, context, user_context)))
+
+    async def acached(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None):
+        return await self._acache_get(self._cache_key(self._full_prompt(prompt, context, user_context)))
+
+    def generate(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None,
+                 priority: int = BACKGROUND) -> str:
+        full_prompt = self._full_prompt(prompt, context, user_context)
+
+        # Cache RAM borné (LRU + TTL) puis cache SQLite partagé entre workers
+        key = self._cache_key(full_prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        # Un prompt identique déjà en cours d'envoi : on attend sa réponse au lieu de relancer un appel
+        return inflight.do(key, lambda: self._call(full_prompt, key, priority))
+
+    @staticmethod
+    def _should_retry(error: RateLimitError, attempt: int, max_retries: int) -> bool:
+        wait = error.retry_after if error.retry_after is not None else DEFAULT_RETRY_AFTER
+        if attempt >= max_retries or wait > MAX_RETRY_WAIT:
+            return False
+        print(f"⏳ Quota atteint, nouvel essai dans {wait:.0f}s")
+        return True
+
+    def _call(self, full_prompt: str, key: str, priority: int = BACKGROUND) -> str:
+        limiter = get_limiter(self.provider)
+        prompt_budget.record(f"llm:{self.provider}", prompt_budget.count_tokens(full_prompt, self.provider))
+        if llm_replay.MODE == "replay":
+            # Réponse enregistrée, latence simulée ; pas de quota à protéger donc pas de limiteur
+            return llm_replay.replay(full_prompt)
         try:
-            if self.provider == "gemini":
-                result = self._generate_gemini(full_prompt, start)
-            elif self.provider == "groq":
-                result = self._generate_groq(full_prompt, start)
-            else:
-                 raise ValueError(f"Provider non supporté ou désactivé : {self.provider}")
-            
-            self.cache[full_prompt] = result
+            for attempt in range(self.max_retries + 1):
+                try:
+                    # Le limiteur fait attendre le Retry-After avant de rendre la main
+                    with limiter.slot_sync(priority):
+                        start = time.time()
+                        if self.provider == "gemini":
+                            result = self._generate_gemini(full_prompt, start)
+                        elif self.provider in OPENAI_COMPATIBLE:
+                            result = self._generate_groq(full_prompt, start)
+                        elif self.provider == "ollama":
+                            result = self._generate_ollama(full_prompt, start)
+                        else:
+                            raise ValueError(f"Provider non supporté ou désactivé : {self.provider}")
+                    break
+                except RateLimitError as e:
+                    if not self._should_retry(e, attempt, self.max_retries):
+                        raise
+
+            self._record(full_prompt, result, start)
+            self._cache_set(key, result)
+            return result
+
+        except Exception as e:
+            print(f"❌ Erreur LLM ({self.provider}): {e}")
+            raise e
+
+    def _record(self, full_prompt: str, result: str, start: float):
+        if llm_replay.MODE == "record":
+            llm_replay.recordings.record(full_prompt, result, self.provider, self.model_name or self.ollama_model,
+                                         time.time() - start)
+
+    async def agenerate(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None,
+                        priority: int = BACKGROUND) -> str:
+        """Version asynchrone de generate : attend la réponse sans bloquer la boucle ni occuper un thread."""
+        full_prompt = self._full_prompt(prompt, context, user_context)
+
+        key = self._cache_key(full_prompt)
+        cached = await self._acache_get(key)
+        if cached is not None:
+            return cached
+
+        return await ainflight.do(key, lambda: self._acall(full_prompt, key, priority))
+
+    async def _acall(self, full_prompt: str, key: str, priority: int = BACKGROUND) -> str:
+        limiter = get_limiter(self.provider)
+        prompt_budget.record(f"llm:{self.provider}", prompt_budget.count_tokens(full_prompt, self.provider))
+        if llm_replay.MODE == "replay":
+            return await llm_replay.areplay(full_prompt)
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with limiter.slot(priority):
+                        start = time.time()
+                        if self.provider == "gemini":
+                            result = await self._agenerate_gemini(full_prompt, start)
+                        elif self.provider in OPENAI_COMPATIBLE:
+                            result = await self._agenerate_groq(full_prompt, start)
+                        elif self.provider == "ollama":
+                            result = await self._agenerate_ollama(full_prompt, start)
+                        else:
+                            raise ValueError(f"Provider non supporté ou désactivé : {self.provider}")
+                    break
+                except RateLimitError as e:
+                    if not self._should_retry(e, attempt, self.max_retries):
+                        raise
+
+            self._record(full_prompt, result, start)
+            await self._acache_set(key, result)
             return result
-            
+
+        except Exception as e:
+            print(f"❌ Erreur LLM ({self.provider}): {e}")
+            raise e
+
+    async def astream(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None,
+                      priority: int = BACKGROUND) -> AsyncIterator[str]:
+        """
+        Génère la réponse morceau par morceau (tokens) au fil de l'eau.
+        Une réponse déjà en cache est renvoyée en un seul morceau ; la réponse complète est mise en cache à la fin.
+        """
+        full_prompt = self._full_prompt(prompt, context, user_context)
+        key = self._cache_key(full_prompt)
+        cached = await self._acache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        if llm_replay.MODE == "replay":
+            chunks = llm_replay.astream_replay(full_prompt)
+        elif self.provider == "gemini":
+            chunks = self._astream_gemini(full_prompt)
+        elif self.provider in OPENAI_COMPATIBLE:
+            chunks = self._astream_groq(full_prompt)
+        elif self.provider == "ollama":
+            chunks = self._astream_ollama(full_prompt)
+        else:
+            raise ValueError(f"Provider non supporté ou désactivé : {self.provider}")
+
+        prompt_budget.record(f"llm:{self.provider}", prompt_budget.count_tokens(full_prompt, self.provider))
+        first_token = None
+        parts = []
+        try:
+            # La place est gardée pendant tout le flux (pas de limiteur en rejeu)
+            slot = get_limiter(self.provider).slot(priority) if llm_replay.MODE != "replay" else contextlib.nullcontext()
+            async with slot:
+                start = time.time()
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if first_token is None:
+                        first_token = time.time() - start
+                    parts.append(chunk)
+                    yield chunk
         except Exception as e:
             print(f"❌ Erreur LLM ({self.provider}): {e}")
             raise e
 
+        print(f"⏱️ Streaming {self.provider} : 1er token {first_token or 0:.2f}s, total {time.time() - start:.2f}s")
+        result = "".join(parts).strip()
+        if result:
+            self._record(full_prompt, result, start)
+            await self._acache_set(key, result)
+
+    def _rate_limited(self, error: Exception) -> bool:
+        # Erreurs google.genai : le statut HTTP est dans `code`
+        return getattr(error, "code", None) == 429
+
     def _generate_gemini(self, prompt, start_time):
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=prompt
-        )
+        try:
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=prompt
+            )
+        except Exception as e:
+            if self._rate_limited(e):
+                raise RateLimitError("Quota Gemini dépassé (429)") from e
+            raise
         print(f"⏱️ Gemini : {time.time() - start_time:.2f}s")
         return response.text.strip()
 
-    def _generate_groq(self, prompt, start_time):
+    async def _agenerate_gemini(self, prompt, start_time):
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt
+            )
+        except Exception as e:
+            if self._rate_limited(e):
+                raise RateLimitError("Quota Gemini dépassé (429)") from e
+            raise
+        print(f"⏱️ Gemini : {time.time() - start_time:.2f}s")
+        return response.text.strip()
+
+    async def _astream_gemini(self, prompt):
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model_name,
+                contents=prompt
+            )
+        except Exception as e:
+            if self._rate_limited(e):
+                raise RateLimitError("Quota Gemini dépassé (429)") from e
+            raise
+        async for chunk in stream:
+            yield chunk.text or ""
+
+    def _groq_request(self, prompt):
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -111,40 +442,91 @@ class LLMEngine:
         else:
             messages.append({"role": "user", "content": prompt})
 
-        # Utilisation du dernier modèle Llama 3.3 (Rapide et supporté)
-        model_id = "llama-3.3-70b-versatile" 
-        
         payload = {
-            "model": model_id,
+            "model": self.model_name,
             "messages": messages,
-            "temperature": 0.3
+            "temperature": self.temperature
         }
-        
-        response = requests.post(self.api_url, json=payload, headers=headers, timeout=30)
-        
-        if not response.ok:
-            error_details = response.text
-            print(f"❌ Erreur Groq {response.status_code}: {error_details}")
-            if response.status_code == 429:
-                raise RuntimeError("Quota Groq dépassé (429)")
-            raise RuntimeError(f"Groq API Error {response.status_code}: {error_details}")
-            
-        res_json = response.json()
-        print(f"⏱️ Groq ({model_id}) : {time.time() - start_time:.2f}s")
+        return headers, payload
+
+    def _groq_result(self, status_code, text, json_fn, start_time, headers=None):
+        label = "Groq" if self.provider == "groq" else "OpenAI-compatible"
+        if status_code >= 400:
+            print(f"❌ Erreur {label} {status_code}: {text}")
+            if status_code == 429:
+                retry_after = parse_retry_after((headers or {}).get("retry-after"))
+                raise RateLimitError(f"Quota {label} dépassé (429)", retry_after)
+            raise RuntimeError(f"{label} API Error {status_code}: {text}")
+
+        res_json = json_fn()
+        print(f"⏱️ {label} ({self.model_name}) : {time.time() - start_time:.2f}s")
         return res_json["choices"][0]["message"]["content"].strip()
 
-    def _generate_ollama(self, prompt, start_time):
-        payload = {
+    def _generate_groq(self, prompt, start_time):
+        headers, payload = self._groq_request(prompt)
+        response = get_session().post(self.api_url, json=payload, headers=headers, timeout=30)
+        return self._groq_result(response.status_code, response.text, response.json, start_time, response.headers)
+
+    async def _agenerate_groq(self, prompt, start_time):
+        headers, payload = self._groq_request(prompt)
+        response = await get_async_client().post(self.api_url, json=payload, headers=headers)
+        return self._groq_result(response.status_code, response.text, response.json, start_time, response.headers)
+
+    async def _astream_groq(self, prompt):
+        headers, payload = self._groq_request(prompt)
+        payload["stream"] = True
+        async with get_async_client().stream("POST", self.api_url, json=payload, headers=headers) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                self._groq_result(response.status_code, response.text, response.json, time.time(), response.headers)
+            # Server-Sent Events au format OpenAI : "data: {...}" puis "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                yield delta.get("content") or ""
+
+    def _ollama_payload(self, prompt, stream=False):
+        return {
             "model": self.ollama_model,
             "prompt": prompt,
-            "stream": False,
-            "options": {"temperature": 0.3, "num_ctx": 4096}
+            "stream": stream,
+            "options": {"temperature": self.temperature, "num_ctx": 4096}
         }
+
+    async def _agenerate_ollama(self, prompt, start_time):
+        try:
+            response = await get_async_client().post(self.api_url, json=self._ollama_payload(prompt), timeout=60)
+            response.raise_for_status()
+            print(f"⏱️ Ollama ({self.ollama_model}) : {time.time() - start_time:.2f}s")
+            return response.json().get("response", "").strip()
+        except Exception as e:
+            # Exception (et non texte d'erreur) : pas de mise en cache, et le routeur peut basculer
+            raise RuntimeError(f"Erreur Ollama : {str(e)}. Vérifiez que 'ollama serve' tourne.") from e
+
+    async def _astream_ollama(self, prompt):
+        # Ollama renvoie du NDJSON : un objet {"response": "...", "done": false} par ligne
+        async with get_async_client().stream("POST", self.api_url, json=self._ollama_payload(prompt, stream=True),
+                                             timeout=60) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                yield data.get("response", "")
+                if data.get("done"):
+                    break
+
+    def _generate_ollama(self, prompt, start_time):
         try:
-            response = requests.post(self.api_url, json=payload, timeout=60)
+            response = get_session().post(self.api_url, json=self._ollama_payload(prompt), timeout=60)
             response.raise_for_status()
             res_json = response.json()
             print(f"⏱️ Ollama ({self.ollama_model}) : {time.time() - start_time:.2f}s")
             return res_json.get("response", "").strip()
         except Exception as e:
-            return f"Erreur Ollama : {str(e)}. Vérifiez que 'ollama serve' tourne."
+            # Exception (et non texte d'erreur) : pas de mise en cache, et le routeur peut basculer
+            raise RuntimeError(f"Erreur Ollama : {str(e)}. Vérifiez que 'ollama serve' tourne.") from e
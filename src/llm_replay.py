@@ -0,0 +1,132 @@
+# backend/src/llm_replay.py - Enregistrement / rejeu des appels LLM (benchmarks et tests hors ligne)
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from src.prompt_budget import count_tokens
+
+# live : appels réels ; record : appels réels + enregistrement ; replay : réponses enregistrées, aucun appel réseau
+MODE = os.getenv("LLM_MODE", "live").lower()
+RECORDINGS_FILE = os.getenv("LLM_RECORDINGS", "data/llm_recordings.jsonl")
+
+# Simulation en rejeu : délai avant le 1er token, puis débit en tokens/seconde (0 = instantané)
+REPLAY_LATENCY = float(os.getenv("LLM_REPLAY_LATENCY", 0.3))
+REPLAY_TOKENS_PER_SEC = float(os.getenv("LLM_REPLAY_TOKENS_PER_SEC", 200))
+
+# Prompt jamais enregistré : "placeholder" (réponse factice) ou "error"
+REPLAY_MISS = os.getenv("LLM_REPLAY_MISS", "placeholder")
+PLACEHOLDER = "Réponse simulée : aucun enregistrement pour ce prompt."
+
+
+def prompt_key(full_prompt: str) -> str:
+    """Clé d'enregistrement : le prompt complet seul, pour rejouer quel que soit le fournisseur configuré."""
+    return hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
+
+
+class Recordings:
+    """Paires prompt/réponse au format JSONL (une ligne par appel), chargées en mémoire au premier accès."""
+
+    def __init__(self, path: str = RECORDINGS_FILE):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry  # Le dernier enregistrement d'un prompt gagne
+
+    def record(self, full_prompt: str, response: str, provider: str, model: str, latency: float):
+        entry = {
+            "key": prompt_key(full_prompt),
+            "provider": provider,
+            "model": model,
+            "prompt": full_prompt,
+            "response": response,
+            "latency_sec": round(latency, 3),
+            "prompt_tokens": count_tokens(full_prompt, provider),
+            "completion_tokens": count_tokens(response, provider),
+            "recorded_at": time.time(),
+        }
+        with self._lock:
+            self._load()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._entries[entry["key"]] = entry
+            self.recorded += 1
+
+    def lookup(self, full_prompt: str) -> dict:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(prompt_key(full_prompt))
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None:
+            if REPLAY_MISS == "error":
+                raise RuntimeError("Rejeu LLM : aucun enregistrement pour ce prompt")
+            return {"response": PLACEHOLDER, "completion_tokens": count_tokens(PLACEHOLDER)}
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {
+                "mode": MODE,
+                "path": self.path,
+                "entries": len(self._entries),
+                "recorded": self.recorded,
+                "hits": self.hits,
+                "misses": self.misses,
+                "latency_sec": REPLAY_LATENCY,
+                "tokens_per_sec": REPLAY_TOKENS_PER_SEC,
+            }
+
+
+recordings = Recordings()
+
+
+def _generation_time(entry: dict) -> float:
+    if not REPLAY_TOKENS_PER_SEC:
+        return 0.0
+    tokens = entry.get("completion_tokens") or count_tokens(entry["response"])
+    return tokens / REPLAY_TOKENS_PER_SEC
+
+
+def replay(full_prompt: str) -> str:
+    entry = recordings.lookup(full_prompt)
+    time.sleep(REPLAY_LATENCY + _generation_time(entry))
+    return entry["response"]
+
+
+async def areplay(full_prompt: str) -> str:
+    entry = recordings.lookup(full_prompt)
+    await asyncio.sleep(REPLAY_LATENCY + _generation_time(entry))
+    return entry["response"]
+
+
+async def astream_replay(full_prompt: str, chunk_words: int = 4):
+    """Rejoue la réponse par petits morceaux, au débit simulé."""
+    entry = recordings.lookup(full_prompt)
+    await asyncio.sleep(REPLAY_LATENCY)
+    words = entry["response"].split(" ")
+    chunks = [" ".join(words[i:i + chunk_words]) for i in range(0, len(words), chunk_words)]
+    pause = _generation_time(entry) / max(1, len(chunks))
+    for i, chunk in enumerate(chunks):
+        yield chunk if i == 0 else " " + chunk
+        if pause:
+            await asyncio.sleep(pause)
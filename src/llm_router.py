@@ -0,0 +1,287 @@
+# backend/src/llm_router.py - Routage entre fournisseurs LLM : latence, basculement et requêtes "hedgées"
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+from src.llm_engine import LLMEngine
+from src.rate_limiter import BACKGROUND, RateLimitError
+
+# Fournisseurs candidats (en plus du fournisseur choisi par l'utilisateur) ;
+# Ollama seulement si OLLAMA_URL est défini, endpoint compatible OpenAI si LLM_OPENAI_BASE_URL l'est
+DEFAULT_PROVIDERS = ["groq", "gemini"]
+
+# "primary" : le fournisseur choisi passe en premier tant qu'il est sain ; "latency" : le plus rapide (p50) d'abord
+ROUTING = os.getenv("LLM_ROUTING", "primary")
+
+# Délai avant d'envoyer la même requête à un 2e fournisseur : secondes, "auto" (p95 du 1er) ou 0 (désactivé)
+HEDGE_AFTER = os.getenv("LLM_HEDGE_AFTER", "0")
+PROVIDER_TIMEOUT = float(os.getenv("LLM_PROVIDER_TIMEOUT", 60))
+
+WINDOW = 100            # Derniers appels pris en compte par fournisseur
+UNHEALTHY_RATE = 0.5    # Taux d'erreur à partir duquel un fournisseur passe en dernier
+COOLDOWN = 60           # ... pendant cette durée après son dernier échec, puis il est retenté
+MIN_SAMPLES = 3
+
+
+class ProviderHealth:
+    """Fenêtre glissante des derniers appels d'un fournisseur : latences (p50/p95) et taux d'erreur."""
+
+    def __init__(self):
+        self._samples = deque(maxlen=WINDOW)     # (latence ou None, succès)
+        self._lock = threading.Lock()
+        self.last_failure = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, ok: bool, latency: float = None):
+        with self._lock:
+            self._samples.append((latency, ok))
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+                self.last_failure = time.time()
+
+    def percentile(self, q: float):
+        with self._lock:
+            latencies = sorted(lat for lat, ok in self._samples if ok and lat is not None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def error_rate(self):
+        with self._lock:
+            if not self._samples:
+                return None
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def unhealthy(self) -> bool:
+        with self._lock:
+            count = len(self._samples)
+        rate = self.error_rate()
+        return (count >= MIN_SAMPLES and rate is not None and rate >= UNHEALTHY_RATE
+                and time.time() - self.last_failure < COOLDOWN)
+
+    def stats(self) -> dict:
+        p50, p95, rate = self.percentile(0.5), self.percentile(0.95), self.error_rate()
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "p50_sec": round(p50, 3) if p50 is not None else None,
+            "p95_sec": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(rate, 3) if rate is not None else None,
+            "healthy": not self.unhealthy(),
+        }
+
+
+class ProviderRouter:
+    """
+    Même interface que LLMEngine (generate / agenerate / astream), répartie sur tous les fournisseurs configurés.
+    En cas d'erreur, de quota ou de timeout, la requête bascule sur le fournisseur suivant ;
+    si LLM_HEDGE_AFTER est défini, une requête trop lente est aussi envoyée au suivant et la 1re réponse gagne.
+    """
+
+    def __init__(self, provider: str = "groq", gemini_api_key: str = None, ollama_model: str = "phi3:mini",
+                 providers: list = None):
+        self.provider = provider.lower()
+        if providers is None:
+            providers = [p.strip() for p in os.getenv("LLM_PROVIDERS", ",".join(DEFAULT_PROVIDERS)).split(",") if p.strip()]
+            if os.getenv("OLLAMA_URL"):
+                providers.append("ollama")
+            if os.getenv("LLM_OPENAI_BASE_URL"):
+                providers.append("openai")
+
+        built = {
+            name: LLMEngine(provider=name, gemini_api_key=gemini_api_key, ollama_model=ollama_model)
+            for name in dict.fromkeys([self.provider] + providers)
+        }
+        self.engines = {name: engine for name, engine in built.items() if engine.available}
+        if not self.engines:
+            # Aucun fournisseur utilisable : on garde le principal pour remonter ses erreurs habituelles
+            self.engines[self.provider] = built[self.provider]
+        if len(self.engines) > 1:
+            # Sur 429 on bascule tout de suite plutôt que d'attendre le Retry-After du même fournisseur
+            for engine in self.engines.values():
+                engine.max_retries = 0
+
+        self.cache = next(iter(self.engines.values())).cache
+        self.health = {name: ProviderHealth() for name in self.engines}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        print(f"Routeur LLM : {', '.join(self.engines)} (routage {ROUTING})")
+
+    @property
+    def token_budget(self) -> int:
+        """Budget du plus petit contexte parmi les fournisseurs : le prompt doit tenir après une bascule."""
+        return min(engine.token_budget for engine in self.engines.values())
+
+    def _ranked(self) -> list:
+        def key(name):
+            health = self.health[name]
+            primary = 0 if ROUTING == "primary" and name == self.provider else 1
+            p50 = health.percentile(0.5)
+            return (health.unhealthy(), primary, p50 if p50 is not None else PROVIDER_TIMEOUT)
+
+        return [self.engines[name] for name in sorted(self.engines, key=key)]
+
+    def _hedge_delay(self, engine: LLMEngine):
+        if HEDGE_AFTER in ("", "0"):
+            return None
+        if HEDGE_AFTER == "auto":
+            p95 = self.health[engine.provider].percentile(0.95)
+            return p95 if p95 is not None else 5.0
+        return float(HEDGE_AFTER)
+
+    @staticmethod
+    def _failure(errors: list) -> Exception:
+        # errors : [(fournisseur, exception)]. Tous en quota dépassé -> RateLimitError (délai le plus court)
+        message = f"Tous les fournisseurs LLM ont échoué ({' | '.join(f'{name} : {e}' for name, e in errors)})"
+        if errors and all(isinstance(e, RateLimitError) for _, e in errors):
+            waits = [e.retry_after for _, e in errors if e.retry_after is not None]
+            return RateLimitError(message + " (429)", min(waits) if waits else None)
+        return RuntimeError(message)
+
+    def _cached(self, prompt, context, user_context):
+        for engine in self.engines.values():
+            cached = engine.cached(prompt, context, user_context)
+            if cached is not None:
+                return cached
+        return None
+
+    async def _acached(self, prompt, context, user_context):
+        for engine in self.engines.values():
+            cached = await engine.acached(prompt, context, user_context)
+            if cached is not None:
+                return cached
+        return None
+
+    def generate(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None,
+                 priority: int = BACKGROUND) -> str:
+        cached = self._cached(prompt, context, user_context)
+        if cached is not None:
+            return cached
+
+        errors = []
+        for engine in self._ranked():
+            start = time.time()
+            try:
+                result = engine.generate(prompt, context=context, user_context=user_context, priority=priority)
+            except Exception as e:
+                self.health[engine.provider].record(False)
+                errors.append((engine.provider, e))
+                continue
+            self.health[engine.provider].record(True, time.time() - start)
+            if errors:
+                self.failovers += 1
+            return result
+        raise self._failure(errors)
+
+    async def _attempt(self, engine: LLMEngine, prompt, context, user_context, priority) -> str:
+        start = time.time()
+        try:
+            result = await asyncio.wait_for(
+                engine.agenerate(prompt, context=context, user_context=user_context, priority=priority),
+                timeout=PROVIDER_TIMEOUT,
+            )
+        except asyncio.CancelledError:
+            raise  # Perdant d'une requête hedgée : ni succès ni échec
+        except Exception as e:
+            self.health[engine.provider].record(False)
+            if isinstance(e, asyncio.TimeoutError):
+                raise RuntimeError(f"Timeout après {PROVIDER_TIMEOUT:.0f}s") from e
+            raise
+        self.health[engine.provider].record(True, time.time() - start)
+        return result
+
+    async def agenerate(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None,
+                        priority: int = BACKGROUND) -> str:
+        cached = await self._acached(prompt, context, user_context)
+        if cached is not None:
+            return cached
+
+        candidates = iter(self._ranked())
+        pending = {}          # tâche -> fournisseur
+        errors = []
+        hedged = False
+
+        def launch() -> bool:
+            engine = next(candidates, None)
+            if engine is None:
+                return False
+            task = asyncio.create_task(self._attempt(engine, prompt, context, user_context, priority))
+            pending[task] = engine
+            return True
+
+        launch()
+        first = next(iter(pending.values()), None)
+        try:
+            while pending:
+                delay = None
+                if not hedged and len(pending) == 1:
+                    delay = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Le 1er fournisseur tarde : on lance la même requête sur le suivant
+                    hedged = True
+                    if launch():
+                        self.hedges += 1
+                    continue
+
+                for task in done:
+                    engine = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and engine is not first:
+                            self.hedge_wins += 1
+                        elif errors:
+                            self.failovers += 1
+                        return task.result()
+                    errors.append((engine.provider, task.exception()))
+                    print(f"⚠️ Fournisseur {engine.provider} en échec, bascule : {task.exception()}")
+                if not pending:
+                    launch()
+        finally:
+            # Perdants : l'appel partagé (single-flight) est annulé aussi s'ils étaient ses seuls appelants
+            for task in pending:
+                task.cancel()
+
+        raise self._failure(errors)
+
+    async def astream(self, prompt: str, context: Optional[str] = None, user_context: Optional[str] = None,
+                      priority: int = BACKGROUND) -> AsyncIterator[str]:
+        """Streaming : bascule possible tant qu'aucun morceau n'a été envoyé au client."""
+        errors = []
+        for engine in self._ranked():
+            started = False
+            start = time.time()
+            try:
+                async for chunk in engine.astream(prompt, context=context, user_context=user_context,
+                                                  priority=priority):
+                    if not started:
+                        # Latence = temps jusqu'au 1er morceau
+                        self.health[engine.provider].record(True, time.time() - start)
+                        started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                self.health[engine.provider].record(False)
+                errors.append((engine.provider, e))
+                print(f"⚠️ Fournisseur {engine.provider} en échec, bascule : {e}")
+        raise self._failure(errors)
+
+    def stats(self) -> dict:
+        return {
+            "primary": self.provider,
+            "routing": ROUTING,
+            "hedge_after": HEDGE_AFTER,
+            "order": [engine.provider for engine in self._ranked()],
+            "providers": {name: health.stats() for name, health in self.health.items()},
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
@@ -0,0 +1,73 @@
+# backend/src/llm_standin.py - Serveur LLM local compatible OpenAI, qui rejoue data/llm_recordings.jsonl
+#
+# Lancement :  uvicorn src.llm_standin:app --port 8001
+# Backend :    LLM_OPENAI_BASE_URL=http://127.0.0.1:8001/v1  puis llm_provider "openai"
+# Latence et débit simulés : LLM_REPLAY_LATENCY, LLM_REPLAY_TOKENS_PER_SEC (cf. src/llm_replay.py)
+
+import json
+import os
+import time
+import uuid
+from fastapi import Body, FastAPI
+from fastapi.responses import StreamingResponse
+from src.llm_replay import recordings, areplay, astream_replay
+from src.prompt_budget import count_tokens
+
+MODEL_ID = os.getenv("LLM_STANDIN_MODEL", "dbaai-standin")
+
+app = FastAPI(title="DBA AI - LLM stand-in", description="Rejoue des réponses enregistrées (API OpenAI)")
+
+
+def _full_prompt(messages: list) -> str:
+    # LLMEngine découpe le prompt complet en system/user sur le 1er "\n\n" : on le reconstitue à l'identique
+    return "\n\n".join(message.get("content", "") for message in messages)
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": MODEL_ID, "object": "model", "owned_by": "standin"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(payload: dict = Body(...)):
+    full_prompt = _full_prompt(payload.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = payload.get("model") or MODEL_ID
+
+    if payload.get("stream"):
+        async def events():
+            def chunk(delta: dict, finish_reason=None) -> str:
+                data = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+            yield chunk({"role": "assistant"})
+            async for text in astream_replay(full_prompt):
+                yield chunk({"content": text})
+            yield chunk({}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    response = await areplay(full_prompt)
+    prompt_tokens, completion_tokens = count_tokens(full_prompt), count_tokens(response)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": response}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return recordings.stats()
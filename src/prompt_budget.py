@@ -0,0 +1,151 @@
+# backend/src/prompt_budget.py - Budget de tokens des prompts : comptage, compaction des tableaux, rognage
+
+import os
+import threading
+import pandas as pd
+
+# Comptage exact optionnel (tiktoken) ; sinon estimation au nombre de caractères
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+    HAS_TIKTOKEN = True
+except Exception:
+    _encoding = None
+    HAS_TIKTOKEN = False
+
+# Caractères par token (estimation sans tiktoken ; texte français + SQL)
+CHARS_PER_TOKEN = {"groq": 3.5, "gemini": 4.0, "ollama": 3.5}
+
+# Tokens maximum par prompt (réserve faite pour la réponse). Surcharge : LLM_PROMPT_BUDGET_<PROVIDER>
+DEFAULT_BUDGETS = {
+    "groq": 6000,      # Limite de tokens/minute du palier gratuit
+    "gemini": 24000,
+    "ollama": 3000,    # num_ctx 4096 moins la réponse
+    "openai": 8000,
+}
+
+TRIM_MARKER = "... ({n} lignes omises)"
+
+
+def count_tokens(text: str, provider: str = None) -> int:
+    if not text:
+        return 0
+    if HAS_TIKTOKEN:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN.get(provider, 3.5)) + 1
+
+
+def budget_for(provider: str) -> int:
+    default = DEFAULT_BUDGETS.get(provider, 4000)
+    return int(os.getenv(f"LLM_PROMPT_BUDGET_{(provider or '').upper()}", default))
+
+
+def compact_table(df, columns: list = None) -> str:
+    """DataFrame -> CSV dense (sans l'alignement par espaces de to_string, ni index)."""
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    return df.to_csv(index=False, lineterminator="\n").strip()
+
+
+def compact_records(records: list, index_name: str = None) -> str:
+    """Liste de dicts -> CSV dense ; `index_name` ajoute la position de chaque ligne en 1re colonne."""
+    df = pd.DataFrame(records)
+    if index_name:
+        df.insert(0, index_name, range(len(df)))
+    return compact_table(df)
+
+
+class Section:
+    """
+    Morceau de prompt. `priority` : 0 = indispensable (jamais rogné), plus grand = rogné en premier.
+    Une section `tabular` (CSV) perd ses dernières lignes, en gardant l'en-tête ; une section texte est tronquée.
+    """
+
+    def __init__(self, name: str, text: str, priority: int = 1, tabular: bool = False, title: str = None):
+        self.name = name
+        self.text = text or ""
+        self.priority = priority
+        self.tabular = tabular
+        self.title = title
+
+    def render(self) -> str:
+        return f"{self.title}\n{self.text}" if self.title else self.text
+
+
+def _trim_tabular(section: Section, excess: int, provider: str) -> int:
+    lines = section.text.split("\n")
+    header, rows = lines[:1], lines[1:]
+    # Coût par ligne ramené au coût réel du bloc (compter ligne à ligne surestime les petits morceaux)
+    row_costs = [count_tokens(row, provider) + 1 for row in rows]
+    scale = count_tokens(section.text, provider) / max(1, sum(row_costs) + count_tokens(header[0], provider))
+    removed, saved = 0, 0
+    while rows and saved < excess:
+        rows.pop()
+        saved += row_costs.pop() * scale
+        removed += 1
+    section.text = "\n".join(header + rows + [TRIM_MARKER.format(n=removed)])
+    return removed
+
+
+def _trim_text(section: Section, excess: int, provider: str) -> int:
+    cut = int((excess + 8) * CHARS_PER_TOKEN.get(provider, 3.5))
+    removed = min(cut, len(section.text))
+    section.text = section.text[:len(section.text) - removed] + " ...[tronqué]"
+    return removed
+
+
+def build_prompt(sections: list, provider: str, budget: int = None, tag: str = None, reserve: int = 0):
+    """
+    Assemble les sections dans l'ordre donné, en rognant les moins prioritaires tant que le total
+    dépasse `budget` - `reserve` (réserve : tokens déjà pris ailleurs, par ex. le contexte RAG).
+    Retourne (prompt, usage) ; usage = {"tokens", "budget", "trimmed": {section: lignes/caractères retirés}}.
+    """
+    budget = (budget or budget_for(provider)) - reserve
+    costs = {id(s): count_tokens(s.render(), provider) + 1 for s in sections}
+    total = sum(costs.values())
+    trimmed = {}
+
+    for section in sorted((s for s in sections if s.priority > 0), key=lambda s: -s.priority):
+        if total <= budget:
+            break
+        excess = total - budget
+        before = costs[id(section)]
+        if excess >= before - count_tokens(section.title or "", provider) - 2:
+            # La section entière ne suffit pas à rentrer dans le budget : on la retire
+            trimmed[section.name] = "retirée"
+            section.text, section.title = "", None
+        elif section.tabular:
+            trimmed[section.name] = f"{_trim_tabular(section, excess, provider)} lignes"
+        else:
+            trimmed[section.name] = f"{_trim_text(section, excess, provider)} caractères"
+        costs[id(section)] = count_tokens(section.render(), provider) + 1
+        total = sum(costs.values())
+
+    prompt = "\n\n".join(s.render() for s in sections if s.render())
+    usage = {"tokens": count_tokens(prompt, provider), "budget": budget + reserve, "trimmed": trimmed}
+    if tag:
+        record(tag, usage["tokens"], bool(trimmed))
+        if trimmed:
+            print(f"✂️ Prompt {tag} rogné pour tenir en {budget} tokens : {trimmed}")
+    return prompt, usage
+
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+def record(tag: str, tokens: int, trimmed: bool = False):
+    """Cumule les tokens envoyés par appelant (analyseur ou fournisseur)."""
+    with _usage_lock:
+        entry = _usage.setdefault(tag, {"calls": 0, "tokens": 0, "max_tokens": 0, "trimmed_calls": 0})
+        entry["calls"] += 1
+        entry["tokens"] += tokens
+        entry["max_tokens"] = max(entry["max_tokens"], tokens)
+        entry["trimmed_calls"] += int(trimmed)
+
+
+def usage_stats() -> dict:
+    with _usage_lock:
+        stats = {tag: dict(entry, avg_tokens=round(entry["tokens"] / entry["calls"]))
+                 for tag, entry in _usage.items()}
+    return {"tokenizer": "tiktoken/cl100k_base" if HAS_TIKTOKEN else "estimation", "usage": stats}
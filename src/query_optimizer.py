@@ -1,28 +1,35 @@
 import asyncio
 from dependencies import get_llm
 from src.rag_setup import retrieve_context
-from fastapi.concurrency import run_in_threadpool
+from src.prompt_budget import Section, build_prompt, count_tokens
 
 async def optimize_query(sql_query: str, plan_hint: str = ""):
     context = "\n".join(retrieve_context(f"oracle query optimization {sql_query[:100]}"))
     llm = get_llm()
+    reserve = count_tokens(context, llm.provider)
+
+    def prompt(question: str, plan: str = "") -> str:
+        # Une requête SQL démesurée est tronquée pour tenir dans le budget de tokens du fournisseur
+        sections = [Section("question", question, priority=0), Section("sql", sql_query, priority=1)]
+        if plan:
+            sections.append(Section("plan", f"Plan : {plan}", priority=2))
+        text, _ = build_prompt(sections, llm.provider, budget=llm.token_budget, tag="optimize_query",
+                              reserve=reserve)
+        return text
 
     # Lancement parallèle des 3 analyses
-    task_explanation = run_in_threadpool(
-        llm.generate,
-        f"Explique en français pourquoi cette requête Oracle est lente :\n{sql_query}\nPlan : {plan_hint}",
+    task_explanation = llm.agenerate(
+        prompt("Explique en français pourquoi cette requête Oracle est lente :", plan_hint),
         context=context
     )
 
-    task_costly = run_in_threadpool(
-        llm.generate,
-        f"Quels sont les 3 points les plus coûteux dans cette requête ?\n{sql_query}",
+    task_costly = llm.agenerate(
+        prompt("Quels sont les 3 points les plus coûteux dans cette requête ?"),
         context=context
     )
 
-    task_recommendations = run_in_threadpool(
-        llm.generate,
-        f"Propose 3 optimisations concrètes (index, hint, réécriture) pour cette requête :\n{sql_query}",
+    task_recommendations = llm.agenerate(
+        prompt("Propose 3 optimisations concrètes (index, hint, réécriture) pour cette requête :"),
         context=context
     )
 
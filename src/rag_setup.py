@@ -1,81 +1,540 @@
-try:
-    import chromadb
-    from sentence_transformers import SentenceTransformer
-    HAS_RAG = True
-except ImportError:
-    HAS_RAG = False
-
-model = None
-collection = None
-
-if HAS_RAG:
-    try:
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        client = chromadb.PersistentClient(path='data/chroma_db')
-        collection = client.get_or_create_collection(name='oracle_docs')
-        
-        # Sample 15-20 documents
-        documents = [
-            "Oracle Tuning Guide: Use indexes to avoid full table scans.",
-            "Best practice: Add hints like /*+ INDEX */ for query optimization.",
-            "Security: Apply principle of least privilege - avoid GRANT ANY.",
-            "Anomalies: Watch for logins outside business hours.",
-            "Optimization patterns: Rewrite subqueries to joins for better performance.",
-            "Security patterns: Set password expiration to 90 days.",
-            "Anomaly patterns: SQL injection looks like ' OR ''=' in queries.",
-            "Backup: Use RMAN for incremental backups.",
-            "Restore: Use FLASHBACK for point-in-time recovery.",
-            "Performance: Monitor V$SQLSTAT for slow queries.",
-            "Audit: Enable unified auditing for better logs.",
-            "Roles: Avoid default DBA role for users.",
-            "Privileges: Revoke unnecessary system privs.",
-            "Profiles: Set FAILED_LOGIN_ATTEMPTS to 5.",
-            "Events: Monitor wait events in V$SYSTEM_EVENT.",
-            "Index: Create B-tree indexes on frequently filtered columns.",
-            "Hints: Use /*+ PARALLEL */ for large queries.",
-            "Escalation: Detect GRANT statements on critical roles.",
-            "Injection: Look for -- or ; in audit actions.",
-            "RTO/RPO: For critical DB, aim RPO <1h.",
-            "Security risk: Public role has EXECUTE on dangerous packages like UTL_FILE, UTL_HTTP.",
-            "Never grant CREATE ANY PROCEDURE to application users.",
-            "Use Oracle Vault or TDE for sensitive data encryption.",
-            "Monitor failed logins for brute force attacks.",
-            "Use Database Vault to separate duties.",
-            "Flashback table requires undo retention and row movement.",
-            "PITR requires archive log mode.",
-            "Use incremental level 0 + level 1 for efficient backups.",
-            "Validate RMAN backups with RESTORE VALIDATE.",
-            "Use BLOCK CHANGE TRACKING for faster incremental backups.",
-            "Performance: Avoid functions on indexed columns in WHERE.",
-            "Use bind variables to avoid hard parsing.",
-            "Gather stats regularly with DBMS_STATS.",
-            "Use result_cache for repetitive queries.",
-            "Partition large tables for better performance and maintenance.",
-            "DBA 2026 best practice: Use clear annotations for schema personalization in LLM tools.",
-            "For local LLMs with Oracle, assign specific LLM for DBA use cases.",
-            "Oracle 26ai: Built-in AI with LLM choice for personalization.",
-            "Operationalize AI in 2026: Use guardrails for sensitive info in LLM."
-        ]
-
-        # Only add if empty to save time, or just overwrite for demo simplicity
-        if collection.count() == 0:
-            embeddings = model.encode(documents)
-            for i, doc in enumerate(documents):
-                collection.add(ids=[str(i)], embeddings=[embeddings[i].tolist()], metadatas=[{"text": doc}])
-    except Exception as e:
-        print(f"⚠️ RAG Init Error: {e}")
-        HAS_RAG = False
+# backend/src/rag_setup.py - Base de connaissances RAG (ChromaDB + SentenceTransformer), chargée en arrière-plan
 
-def retrieve_context(query, top_k=3):
-    if not HAS_RAG or not collection:
-        return ["(RAG indisponible - Contexte générique utilisé)"]
-    
-    try:
-        query_emb = model.encode(query).tolist()
-        results = collection.query(query_embeddings=[query_emb], n_results=top_k)
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Test de présence seulement : torch / chromadb ne sont importés qu'au chargement du service
+HAS_RAG = all(importlib.util.find_spec(name) is not None for name in ("chromadb", "sentence_transformers"))
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+CHROMA_PATH = os.getenv("RAG_CHROMA_PATH", "data/chroma_db")
+COLLECTION_NAME = "oracle_docs"
+
+# Documents par appel à encode() / upsert() (Chroma refuse les lots de plus de ~5000 éléments)
+INDEX_BATCH = int(os.getenv("RAG_INDEX_BATCH", 1000))
+BUILTIN_SOURCE = "builtin"      # Métadonnée "source" des documents de la liste DOCUMENTS ci-dessous
+
+# Recherche : "chroma" (requête HNSW sur la collection) ou "numpy" (matrice normalisée en mémoire mappée,
+# reconstruite depuis ChromaDB quand le corpus change ; float16 divise la taille par deux)
+BACKEND = os.getenv("RAG_BACKEND", "chroma").lower()
+NUMPY_INDEX_PATH = os.getenv("RAG_NUMPY_INDEX", "data/rag_index")
+NUMPY_DTYPE = os.getenv("RAG_NUMPY_DTYPE", "float32")
+SCAN_BLOCK = 2048       # Lignes converties en float32 à la fois (float16) : le bloc tient dans le cache CPU
+
+# Caches LRU : embeddings des questions (indépendants du corpus) et résultats (vidés à chaque changement d'index)
+EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", 2048))
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", 512))
+
+# Contexte renvoyé tant que le service n'est pas prêt (chargement en cours) ou s'il ne peut pas l'être
+WARMING_CONTEXT = "(RAG en cours d'initialisation - Contexte générique utilisé)"
+UNAVAILABLE_CONTEXT = "(RAG indisponible - Contexte générique utilisé)"
+DEGRADED_CONTEXTS = (WARMING_CONTEXT, UNAVAILABLE_CONTEXT)
+
+DOCUMENTS = [
+    "Oracle Tuning Guide: Use indexes to avoid full table scans.",
+    "Best practice: Add hints like /*+ INDEX */ for query optimization.",
+    "Security: Apply principle of least privilege - avoid GRANT ANY.",
+    "Anomalies: Watch for logins outside business hours.",
+    "Optimization patterns: Rewrite subqueries to joins for better performance.",
+    "Security patterns: Set password expiration to 90 days.",
+    "Anomaly patterns: SQL injection looks like ' OR ''=' in queries.",
+    "Backup: Use RMAN for incremental backups.",
+    "Restore: Use FLASHBACK for point-in-time recovery.",
+    "Performance: Monitor V$SQLSTAT for slow queries.",
+    "Audit: Enable unified auditing for better logs.",
+    "Roles: Avoid default DBA role for users.",
+    "Privileges: Revoke unnecessary system privs.",
+    "Profiles: Set FAILED_LOGIN_ATTEMPTS to 5.",
+    "Events: Monitor wait events in V$SYSTEM_EVENT.",
+    "Index: Create B-tree indexes on frequently filtered columns.",
+    "Hints: Use /*+ PARALLEL */ for large queries.",
+    "Escalation: Detect GRANT statements on critical roles.",
+    "Injection: Look for -- or ; in audit actions.",
+    "RTO/RPO: For critical DB, aim RPO <1h.",
+    "Security risk: Public role has EXECUTE on dangerous packages like UTL_FILE, UTL_HTTP.",
+    "Never grant CREATE ANY PROCEDURE to application users.",
+    "Use Oracle Vault or TDE for sensitive data encryption.",
+    "Monitor failed logins for brute force attacks.",
+    "Use Database Vault to separate duties.",
+    "Flashback table requires undo retention and row movement.",
+    "PITR requires archive log mode.",
+    "Use incremental level 0 + level 1 for efficient backups.",
+    "Validate RMAN backups with RESTORE VALIDATE.",
+    "Use BLOCK CHANGE TRACKING for faster incremental backups.",
+    "Performance: Avoid functions on indexed columns in WHERE.",
+    "Use bind variables to avoid hard parsing.",
+    "Gather stats regularly with DBMS_STATS.",
+    "Use result_cache for repetitive queries.",
+    "Partition large tables for better performance and maintenance.",
+    "DBA 2026 best practice: Use clear annotations for schema personalization in LLM tools.",
+    "For local LLMs with Oracle, assign specific LLM for DBA use cases.",
+    "Oracle 26ai: Built-in AI with LLM choice for personalization.",
+    "Operationalize AI in 2026: Use guardrails for sensitive info in LLM."
+]
+
+
+def content_id(text: str, source: str) -> str:
+    """Identifiant Chroma d'un document : sa source + l'empreinte de son texte (un texte modifié change d'id)."""
+    return f"{source}:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]}"
+
+
+def index_documents(collection, embed, texts: list, source: str, metadatas: list = None) -> dict:
+    """
+    Synchronise les documents d'une source avec la collection, par lots de INDEX_BATCH :
+    seuls les textes nouveaux (ou modifiés) sont encodés puis upsertés, ceux qui ont disparu de
+    la source sont supprimés. Les autres sources ne sont pas touchées. `embed` : liste de textes -> vecteurs.
+    """
+    start = time.perf_counter()
+    metadatas = metadatas or [{} for _ in texts]
+    wanted = {}
+    for text, meta in zip(texts, metadatas):
+        doc_id = content_id(text, source)
+        wanted[doc_id] = (text, dict(meta, text=text, source=source))     # Doublons exacts : un seul document
+
+    existing = set(collection.get(where={"source": source}, include=[])["ids"])
+    new_ids = [doc_id for doc_id in wanted if doc_id not in existing]
+    removed = [doc_id for doc_id in existing if doc_id not in wanted]
+
+    for i in range(0, len(new_ids), INDEX_BATCH):
+        batch = new_ids[i:i + INDEX_BATCH]
+        embeddings = embed([wanted[doc_id][0] for doc_id in batch])
+        collection.upsert(
+            ids=batch,
+            embeddings=[list(map(float, vector)) for vector in embeddings],
+            metadatas=[wanted[doc_id][1] for doc_id in batch],
+        )
+    for i in range(0, len(removed), INDEX_BATCH):
+        collection.delete(ids=removed[i:i + INDEX_BATCH])
+
+    report = {
+        "source": source,
+        "documents": len(wanted),
+        "added": len(new_ids),
+        "deleted": len(removed),
+        "unchanged": len(wanted) - len(new_ids),
+        "sec": round(time.perf_counter() - start, 3),
+    }
+    if new_ids or removed:
+        print(f"Index RAG ({source}) : +{len(new_ids)} / -{len(removed)} documents en {report['sec']}s")
+    return report
+
+
+class RetrievalBackend:
+    """
+    Recherche des `top_k` documents les plus proches d'un embedding de question normalisé.
+    ChromaDB reste la base de référence (index_documents) ; refresh() est appelé après chaque changement.
+    """
+
+    name = None
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def refresh(self):
+        pass
+
+    def search(self, vector, top_k: int) -> list:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "documents": self.collection.count()}
+
+
+class ChromaBackend(RetrievalBackend):
+    name = "chroma"
+
+    def search(self, vector, top_k: int) -> list:
+        results = self.collection.query(query_embeddings=[list(map(float, vector))], n_results=top_k)
         return [meta['text'] for meta in results['metadatas'][0]]
-    except Exception:
-        return []
+
+
+class NumpyBackend(RetrievalBackend):
+    """
+    Recherche exacte par produit scalaire sur une matrice (documents x dimension) de vecteurs normalisés,
+    en float32 ou float16, enregistrée en .npy et ouverte en mémoire mappée : plusieurs workers
+    uvicorn partagent les mêmes pages, et le démarrage ne recopie rien en RAM.
+    La matrice est reconstruite quand la liste des ids de la collection change, dans un nouveau fichier
+    (vectors-<empreinte>.npy, référencé par index.json) : le fichier encore mappé n'est jamais écrasé,
+    ce que Windows refuse.
+    """
+
+    name = "numpy"
+
+    def __init__(self, collection, path: str = NUMPY_INDEX_PATH, dtype: str = NUMPY_DTYPE):
+        super().__init__(collection)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._index = (np.zeros((0, 0), dtype=self.dtype), [])     # (matrice, textes), remplacés d'un bloc
+        self.fingerprint = None
+        self.rebuilds = 0
+        self.last_build_sec = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(ids: list) -> str:
+        return hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+    def _meta_file(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    def refresh(self):
+        with self._lock:
+            fingerprint = self._fingerprint(self.collection.get(include=[])["ids"])
+            if fingerprint == self.fingerprint:
+                return
+            meta_file = self._meta_file()
+            if os.path.exists(meta_file):
+                with open(meta_file, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if (meta["fingerprint"] == fingerprint and meta["dtype"] == self.dtype.name
+                        and os.path.exists(os.path.join(self.path, meta.get("vectors", "")))):
+                    self._load(meta)
+                    return
+            self._build(fingerprint)
+
+    def _build(self, fingerprint: str):
+        start = time.perf_counter()
+        ids, texts, rows = [], [], []
+        total = self.collection.count()
+        for offset in range(0, total, INDEX_BATCH):
+            page = self.collection.get(include=["embeddings", "metadatas"], limit=INDEX_BATCH, offset=offset)
+            ids.extend(page["ids"])
+            texts.extend(meta["text"] for meta in page["metadatas"])
+            rows.append(np.asarray(page["embeddings"], dtype=np.float32))
+        matrix = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        if len(matrix):
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        # Nouveau fichier par version, puis renommage de index.json : un autre worker ne lit jamais un fichier partiel
+        os.makedirs(self.path, exist_ok=True)
+        vectors_name = f"vectors-{fingerprint[:16]}-{self.dtype.name}.npy"
+        vectors_file = os.path.join(self.path, vectors_name)
+        with open(vectors_file + ".tmp", "wb") as f:
+            np.save(f, matrix.astype(self.dtype))
+        os.replace(vectors_file + ".tmp", vectors_file)
+        meta = {"fingerprint": fingerprint, "dtype": self.dtype.name, "vectors": vectors_name,
+                "ids": ids, "texts": texts}
+        meta_file = self._meta_file()
+        with open(meta_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_file + ".tmp", meta_file)
+
+        self.rebuilds += 1
+        self.last_build_sec = round(time.perf_counter() - start, 3)
+        print(f"Index NumPy RAG reconstruit : {len(ids)} documents ({self.dtype.name}) en {self.last_build_sec}s")
+        self._load(meta)
+        self._remove_stale(vectors_name)
+
+    def _load(self, meta: dict):
+        vectors_file = os.path.join(self.path, meta["vectors"])
+        matrix = np.load(vectors_file, mmap_mode="r") if meta["texts"] else np.zeros((0, 0), dtype=self.dtype)
+        self._index = (matrix, meta["texts"])
+        self.fingerprint = meta["fingerprint"]
+
+    def _remove_stale(self, current: str):
+        # Anciennes versions : encore mappées par une recherche en cours ou un autre worker sous Windows,
+        # la suppression échoue et sera retentée à la prochaine reconstruction
+        for name in os.listdir(self.path):
+            if name.startswith("vectors") and name.endswith(".npy") and name != current:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def scores(self, vector) -> np.ndarray:
+        matrix, _ = self._index
+        query = np.asarray(vector, dtype=np.float32)
+        if matrix.dtype == np.float32:
+            return matrix @ query
+        # Pas de BLAS en float16 : calcul en float32 par blocs, sans recopier toute la matrice
+        return np.concatenate([np.asarray(matrix[i:i + SCAN_BLOCK], dtype=np.float32) @ query
+                               for i in range(0, len(matrix), SCAN_BLOCK)])
+
+    def search(self, vector, top_k: int) -> list:
+        _, texts = self._index
+        if not texts:
+            return []
+        scores = self.scores(vector)
+        k = min(top_k, len(texts))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [texts[i] for i in top[np.argsort(-scores[top])]]
+
+    def stats(self) -> dict:
+        matrix, texts = self._index
+        return {
+            "backend": self.name,
+            "documents": len(texts),
+            "dtype": self.dtype.name,
+            "matrix_bytes": int(matrix.nbytes),
+            "path": self.path,
+            "rebuilds": self.rebuilds,
+            "last_build_sec": self.last_build_sec,
+        }
+
+
+BACKENDS = {"chroma": ChromaBackend, "numpy": NumpyBackend}
+
+
+def make_backend(name: str, collection) -> RetrievalBackend:
+    if name not in BACKENDS:
+        print(f"⚠️ RAG_BACKEND inconnu ({name}), recherche via ChromaDB")
+        name = "chroma"
+    return BACKENDS[name](collection)
+
+
+class _LRU:
+    """Petit cache LRU thread-safe (nombre d'entrées borné) pour les embeddings et résultats de recherche."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+class RagService:
+    """
+    Modèle d'embedding + collection ChromaDB, chargés une seule fois dans un thread (start()).
+    Tant que le chargement n'est pas terminé, retrieve() répond tout de suite avec un contexte
+    générique au lieu de bloquer la requête. Durée de chaque étape : startup_report().
+    Les résultats de recherche sont mis en cache par (question, top_k) pour une version donnée du corpus ;
+    ceux des requêtes fixes des analyseurs (precompute()) sont recalculés dès que l'index change.
+    La recherche elle-même passe par self.backend (RAG_BACKEND).
+    """
+
+    def __init__(self):
+        self.model = None
+        self.collection = None
+        self.backend = None
+        self.state = "idle" if HAS_RAG else "unavailable"     # idle | warming | ready | failed | unavailable
+        self.error = None
+        self.stages = {}
+        self.started_at = None
+        self.finished_at = None
+        self.degraded_calls = 0
+        self.last_index = None
+        self.corpus_version = 0
+        self._stale = False              # Index modifié avec refresh=False, backend pas encore à jour
+        self._embeddings = _LRU(EMBEDDING_CACHE_SIZE)
+        self._results = _LRU(RESULT_CACHE_SIZE)
+        self._known_queries = {}         # question -> top_k des requêtes fixes
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> bool:
+        """Lance le chargement en arrière-plan ; sans effet s'il est déjà lancé ou impossible."""
+        with self._lock:
+            if self.state != "idle":
+                return False
+            self.state = "warming"
+            self.started_at = time.time()
+        threading.Thread(target=self._warm_up, name="rag-warmup", daemon=True).start()
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        """Bloque jusqu'à la fin du chargement (scripts, CLI). Retourne True si le service est prêt."""
+        self.start()
+        if self.state == "unavailable":
+            return False
+        self._done.wait(timeout)
+        return self.ready
+
+    def _stage(self, name: str, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.stages[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    def _warm_up(self):
+        try:
+            def load_libraries():
+                import chromadb
+                from sentence_transformers import SentenceTransformer
+                return chromadb, SentenceTransformer
+
+            chromadb, SentenceTransformer = self._stage("import", load_libraries)
+            self.model = self._stage("model_load", lambda: SentenceTransformer(MODEL_NAME))
+            self.collection = self._stage("chroma_open", lambda: chromadb.PersistentClient(path=CHROMA_PATH)
+                                          .get_or_create_collection(name=COLLECTION_NAME))
+            self._stage("index", self._index_builtin)
+            self.backend = make_backend(BACKEND, self.collection)
+            self._stage("backend", self.backend.refresh)
+            self._stage("precompute", self._precompute)
+            self.state = "ready"
+            print(f"RAG prêt en {time.time() - self.started_at:.1f}s : {self.stages}")
+        except Exception as e:
+            print(f"⚠️ RAG Init Error: {e}")
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    def _index_builtin(self):
+        # Anciens ids ("0", "1", ...) d'avant l'indexation par empreinte : remplacés par les ids de contenu
+        legacy = self.collection.get(ids=[str(i) for i in range(len(DOCUMENTS))], include=[])["ids"]
+        if legacy:
+            self.collection.delete(ids=legacy)
+        self.last_index = self.index(DOCUMENTS, source=BUILTIN_SOURCE)
+
+    def index(self, texts: list, source: str, metadatas: list = None, embed=None, refresh: bool = True) -> dict:
+        """
+        index_documents() sur la collection du service ; tout changement invalide les résultats en cache.
+        Plusieurs sources d'affilée (ingestion) : refresh=False sur chacune, puis un seul refresh_index().
+        """
+        report = index_documents(
+            self.collection, embed or (lambda batch: self.model.encode(batch, batch_size=64)),
+            texts, source, metadatas,
+        )
+        if report["added"] or report["deleted"]:
+            if refresh:
+                self.refresh_index()
+            else:
+                self._stale = True
+        return report
+
+    def refresh_index(self):
+        """Met à jour le backend, puis seulement ensuite change de version et vide les résultats en cache :
+        une recherche concurrente ne peut plus mettre en cache un résultat du backend périmé."""
+        self._stale = False
+        if self.backend is not None:
+            self.backend.refresh()
+        with self._lock:
+            self.corpus_version += 1
+        self._results.clear()
+        if self.ready:
+            self._precompute()
+
+    def refresh_if_stale(self):
+        if self._stale:
+            self.refresh_index()
+
+    def embed(self, text: str):
+        """Embedding normalisé d'une question (float32), mis en cache : ne pas modifier le tableau retourné."""
+        vector = self._embeddings.get(text)
+        if vector is None:
+            vector = self.model.encode([text], normalize_embeddings=True)[0]
+            self._embeddings.set(text, vector)
+        return vector
+
+    def precompute(self, query: str, top_k: int = 3):
+        """Déclare une requête fixe (analyseur) : son résultat est calculé à l'indexation plutôt qu'au 1er appel."""
+        self._known_queries[query] = top_k
+        if self.ready:
+            self._search(query, top_k)
+
+    def _precompute(self):
+        for query, top_k in list(self._known_queries.items()):
+            self._search(query, top_k)
+
+    def _search(self, query: str, top_k: int) -> list:
+        version = self.corpus_version
+        cached = self._results.get((query, top_k))
+        if cached is not None:
+            return cached
+        texts = self.backend.search(self.embed(query), top_k)
+        if version == self.corpus_version:
+            # Index modifié pendant la recherche : résultat servi mais pas conservé
+            self._results.set((query, top_k), texts)
+        return texts
+
+    def retrieve(self, query: str, top_k: int = 3) -> list:
+        if not self.ready:
+            # Sans préchauffage (RAG_WARMUP=false), le premier appel lance le chargement
+            self.start()
+            self.degraded_calls += 1
+            return [WARMING_CONTEXT if self.state == "warming" else UNAVAILABLE_CONTEXT]
+
+        try:
+            return list(self._search(query, top_k))
+        except Exception:
+            return []
+
+    def startup_report(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "stages_sec": dict(self.stages),
+            "total_sec": round(end - self.started_at, 3) if self.started_at else None,
+            "error": self.error,
+            "degraded_calls": self.degraded_calls,
+            "documents": self.collection.count() if self.ready else None,
+            "last_index": self.last_index,
+            "backend": self.backend.stats() if self.backend is not None else None,
+        }
+
+    def cache_stats(self) -> dict:
+        return {
+            "corpus_version": self.corpus_version,
+            "embeddings": self._embeddings.stats(),
+            "results": self._results.stats(),
+            "precomputed_queries": list(self._known_queries),
+        }
+
+
+rag = RagService()
+
+
+def retrieve_context(query, top_k=3):
+    return rag.retrieve(query, top_k)
+
+
+def is_degraded(context) -> bool:
+    """Contexte générique (préchauffage ou RAG indisponible) : les réponses bâties dessus ne sont pas mises en cache."""
+    if not context:
+        return False
+    if not isinstance(context, str):
+        context = "\n".join(context)
+    return any(marker in context for marker in DEGRADED_CONTEXTS)
+
+
+def precompute(query, top_k=3):
+    rag.precompute(query, top_k)
+
 
 if __name__ == "__main__":
-    print(retrieve_context("index lent"))
\ No newline at end of file
+    rag.wait()
+    print(rag.startup_report())
+    print(retrieve_context("index lent"))
@@ -0,0 +1,260 @@
+# backend/src/rate_limiter.py - Limiteur de débit adaptatif et file à priorités devant les fournisseurs LLM
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Priorités (plus petit = servi en premier)
+INTERACTIVE = 0     # Chatbot : un utilisateur attend la réponse
+BACKGROUND = 1      # Analyses (audit, anomalies, sauvegarde, optimisation) et collecte
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Limites par défaut (requêtes/minute, concurrence max) ; surcharge par LLM_RPM_<PROVIDER> / LLM_CONCURRENCY_<PROVIDER>
+DEFAULT_LIMITS = {
+    "groq": (30, 4),
+    "gemini": (10, 4),
+    "ollama": (0, 1),      # Local : pas de quota, mais un seul appel à la fois sur la machine
+    "openai": (0, 8),      # Endpoint compatible OpenAI (stand-in local, passerelle interne)
+}
+DEFAULT_RETRY_AFTER = 10.0    # Attente si le fournisseur renvoie 429 sans en-tête Retry-After
+WAIT_SAMPLES = 500            # Temps d'attente conservés pour les percentiles
+
+
+class RateLimitError(RuntimeError):
+    """Le fournisseur a refusé l'appel (HTTP 429). `retry_after` : délai demandé en secondes, si connu."""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value) -> float:
+    """En-tête Retry-After (secondes) -> float, ou None s'il est absent ou illisible."""
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    def __init__(self, priority: int, loop=None):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.abandoned = False
+        self.loop = loop
+        if loop is not None:
+            self.future = loop.create_future()
+        else:
+            self.event = threading.Event()
+
+    def grant(self):
+        self.granted = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ProviderLimiter:
+    """
+    Seau à jetons (`rpm` requêtes/minute, rafale de `burst`) + concurrence adaptative AIMD :
+    la limite remonte de 1/limite à chaque succès et est divisée par deux à chaque 429,
+    qui bloque en plus le fournisseur pendant la durée du Retry-After.
+    Les demandes en attente sont servies par priorité, puis par ordre d'arrivée.
+    """
+
+    def __init__(self, name: str, rpm: float, max_concurrency: int, burst: int = None):
+        self.name = name
+        self.rate = rpm / 60.0
+        self.burst = burst or max(1, max_concurrency)
+        self.tokens = float(self.burst)
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.active = 0
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._queue = []                    # tas de (priorité, n° d'arrivée, _Waiter)
+        self._seq = itertools.count()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._waits = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_NAMES}
+        self.granted = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        # Appelé sous verrou : accorde les places disponibles aux demandes les plus prioritaires
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue and self.active < max(1, int(self.limit)):
+            if now < self.blocked_until:
+                self._schedule(self.blocked_until - now)
+                return
+            if self.rate and self.tokens < 1:
+                self._schedule((1 - self.tokens) / self.rate)
+                return
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.abandoned:
+                continue
+            if self.rate:
+                self.tokens -= 1
+            self.active += 1
+            self.granted += 1
+            self._waits[waiter.priority].append(now - waiter.enqueued)
+            waiter.grant()
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            return
+
+        def wake():
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+
+        self._timer = threading.Timer(delay, wake)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _enqueue(self, waiter: _Waiter):
+        with self._lock:
+            heapq.heappush(self._queue, (waiter.priority, next(self._seq), waiter))
+            self._dispatch()
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                self.active -= 1
+                self._dispatch()
+            else:
+                waiter.abandoned = True
+
+    def release(self, outcome: str = "ok", retry_after: float = None):
+        """Libère une place. `outcome` : "ok", "rate_limited" (429), "error" ou "cancelled"."""
+        with self._lock:
+            self.active -= 1
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif outcome == "rate_limited":
+                self.rate_limited += 1
+                self.limit = max(1.0, self.limit / 2)
+                delay = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            elif outcome == "error":
+                self.errors += 1
+            self._dispatch()
+
+    async def acquire(self, priority: int = BACKGROUND):
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        self._enqueue(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def acquire_sync(self, priority: int = BACKGROUND):
+        waiter = _Waiter(priority)
+        self._enqueue(waiter)
+        waiter.event.wait()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = BACKGROUND):
+        """Place réservée pour un appel ; le résultat (succès, 429, erreur) ajuste la limite."""
+        await self.acquire(priority)
+        outcome, retry_after = "ok", None
+        try:
+            yield
+        except RateLimitError as e:
+            outcome, retry_after = "rate_limited", e.retry_after
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client parti (requête annulée, flux SSE fermé) : ni succès ni erreur du fournisseur
+            outcome = "cancelled"
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.release(outcome, retry_after)
+
+    @contextmanager
+    def slot_sync(self, priority: int = BACKGROUND):
+        self.acquire_sync(priority)
+        outcome, retry_after = "ok", None
+        try:
+            yield
+        except RateLimitError as e:
+            outcome, retry_after = "rate_limited", e.retry_after
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.release(outcome, retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, waiter in self._queue:
+                if not waiter.abandoned:
+                    depth[PRIORITY_NAMES[priority]] += 1
+            waits = {}
+            for priority, samples in self._waits.items():
+                values = sorted(samples)
+                waits[PRIORITY_NAMES[priority]] = {
+                    "samples": len(values),
+                    "avg_sec": round(sum(values) / len(values), 3) if values else None,
+                    "p95_sec": round(values[int(0.95 * (len(values) - 1))], 3) if values else None,
+                }
+            return {
+                "rpm": round(self.rate * 60, 1),
+                "tokens": round(self.tokens, 2) if self.rate else None,
+                "concurrency_limit": round(self.limit, 2),
+                "max_concurrency": self.max_concurrency,
+                "active": self.active,
+                "queue_depth": depth,
+                "blocked_for_sec": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+                "wait": waits,
+                "granted": self.granted,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """Limiteur partagé d'un fournisseur (le quota est celui de la clé API, pas d'une instance de LLMEngine)."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            rpm, concurrency = DEFAULT_LIMITS.get(provider, (0, 4))
+            rpm = float(os.getenv(f"LLM_RPM_{provider.upper()}", rpm))
+            concurrency = int(os.getenv(f"LLM_CONCURRENCY_{provider.upper()}", concurrency))
+            _limiters[provider] = ProviderLimiter(provider, rpm, concurrency)
+        return _limiters[provider]
+
+
+def limiter_stats() -> dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
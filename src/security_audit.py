@@ -1,49 +1,66 @@
 # backend/src/security_audit.py - Audit ultra-personnalisé et accéléré
 
-import pandas as pd
+from src import snapshot_store
 from dependencies import get_llm
-from src.rag_setup import retrieve_context
+from src.rag_setup import is_degraded, precompute, retrieve_context
+from src.rate_limiter import RateLimitError
+from src.prompt_budget import Section, build_prompt, compact_table, count_tokens
 import time
 import json
 import asyncio
 import os
-from fastapi.concurrency import run_in_threadpool
 
 CACHE_FILE = "data/last_audit_cache.json"
-DATA_FILES = ["data/users.csv", "data/roles.csv", "data/privs.csv"]
+INPUT_DATASETS = ["users", "roles", "privs"]
+
+# Requête RAG fixe : résultat calculé dès l'indexation du corpus
+RAG_QUERY = "oracle security risks users roles privileges"
+precompute(RAG_QUERY, top_k=3)
+
+def security_metrics(users_df, roles_df, privs_df) -> dict:
+    """Indicateurs de risque et score de sécurité (0-100), calculés sans LLM."""
+    open_users = len(users_df[users_df['account_status'] == 'OPEN'])
+    any_privs = len(privs_df[privs_df['privilege'].str.contains('ANY', case=False)])
+    dba_users = len(roles_df[roles_df['granted_role'].str.contains('DBA', case=False)])
+
+    score = 100 - (open_users * 2) - (any_privs * 10) - (dba_users * 15)
+    score = max(score, 20)
+    return {"open_users": open_users, "any_privs": any_privs, "dba_users": dba_users, "score": score}
 
 async def audit_security():
     start = time.time()
     
-    # 1. Vérification du Cache (Si les fichiers n'ont pas changé)
+    # 1. Vérification du Cache (si le contenu des snapshots n'a pas changé, d'après leurs empreintes)
+    inputs = snapshot_store.fingerprints(INPUT_DATASETS)
     try:
-        last_mtime = max([os.path.getmtime(f) for f in DATA_FILES if os.path.exists(f)], default=0)
-        if os.path.exists(CACHE_FILE):
+        if os.path.exists(CACHE_FILE) and all(inputs.values()):
             with open(CACHE_FILE, "r") as f:
                 cached = json.load(f)
-            if cached.get("timestamp", 0) >= last_mtime:
+            if cached.get("inputs") == inputs:
                 print("⚡ Cache utilisé pour Audit Sécurité (0s)")
                 return cached["report"]
     except Exception as e:
         print(f"Cache error: {e}")
     try:
-        users_df = pd.read_csv('data/users.csv')
-        roles_df = pd.read_csv('data/roles.csv')
-        privs_df = pd.read_csv('data/privs.csv')
+        # Projection : seules les colonnes utilisées par l'audit sont chargées
+        users_df = snapshot_store.read_table("users", columns=["username", "account_status", "profile"])
+        roles_df = snapshot_store.read_table("roles", columns=["grantee", "granted_role"])
+        privs_df = snapshot_store.read_table("privs", columns=["grantee", "privilege"])
 
 
         # Optimisation : On ne garde que les lignes "intéressantes" (OPEN, DBA, ANY) ou les 50 premières
         users_sample = users_df[users_df['account_status'] == 'OPEN'].head(50)
         if users_sample.empty: users_sample = users_df.head(20)
         
-        users_str = users_sample.to_string(index=False)
-        roles_str = roles_df.head(50).to_string(index=False) # Max 50 roles
-        privs_str = privs_df[privs_df['privilege'].str.contains('ANY|DBA', case=False, na=False)].head(50).to_string(index=False)
-        if len(privs_str) < 10: privs_str = privs_df.head(20).to_string(index=False)
+        # CSV dense plutôt que to_string() : pas d'espaces d'alignement facturés en tokens
+        users_str = compact_table(users_sample)
+        roles_str = compact_table(roles_df.head(50)) # Max 50 roles
+        privs_sample = privs_df[privs_df['privilege'].str.contains('ANY|DBA', case=False, na=False)].head(50)
+        if privs_sample.empty: privs_sample = privs_df.head(20)
+        privs_str = compact_table(privs_sample)
 
-        open_users = len(users_df[users_df['account_status'] == 'OPEN'])
-        any_privs = len(privs_df[privs_df['privilege'].str.contains('ANY', case=False)])
-        dba_users = len(roles_df[roles_df['granted_role'].str.contains('DBA', case=False)])
+        metrics = security_metrics(users_df, roles_df, privs_df)
+        open_users, any_privs, dba_users = metrics["open_users"], metrics["any_privs"], metrics["dba_users"]
 
         # Personnalisation : stats et détection changements
         previous_open = 0  # Charge de previous_security.json si existe
@@ -58,21 +75,16 @@ async def audit_security():
 
         user_context = f"Base utilisateur avec {open_users} users ouverts, {any_privs} ANY, {dba_users} DBA. {change_note}. Orientation DBA : focus moindre privilège, audit."
 
-        score = 100 - (open_users * 2) - (any_privs * 10) - (dba_users * 15)
-        score = max(score, 20)
+        score = metrics["score"]
 
     except Exception as e:
         return {"error": str(e), "score": 0}
 
-    context = "\n".join(retrieve_context("oracle security risks users roles privileges", top_k=3))
+    context = "\n".join(retrieve_context(RAG_QUERY, top_k=3))
 
     try:
         # Optimisation Quota : 1 seul appel au lieu de 3 (Réduit la charge API de 66%)
-        combined_prompt = (
-            f"Analyse la sécurité de cette base Oracle.\n\n"
-            f"DONNEES UTILISATEURS :\n{users_str}\n\n"
-            f"DONNEES ROLES :\n{roles_str}\n\n"
-            f"DONNEES PRIVILEGES :\n{privs_str}\n\n"
+        instructions = (
             f"Instructions :\n"
             f"1. Analyse les risques liés aux utilisateurs/rôles.\n"
             f"2. Analyse les privilèges excessifs.\n"
@@ -87,9 +99,23 @@ async def audit_security():
             f'  "profile_recommendation": "Action concrète pour les profils..."\n'
             f"}}"
         )
+        # Budget de tokens : les rôles sont rognés en premier, puis les utilisateurs, puis les privilèges
+        llm = get_llm()
+        combined_prompt, usage = build_prompt(
+            [
+                Section("intro", "Analyse la sécurité de cette base Oracle.", priority=0),
+                Section("users", users_str, priority=2, tabular=True, title="DONNEES UTILISATEURS (CSV) :"),
+                Section("roles", roles_str, priority=3, tabular=True, title="DONNEES ROLES (CSV) :"),
+                Section("privs", privs_str, priority=1, tabular=True, title="DONNEES PRIVILEGES (CSV) :"),
+                Section("instructions", instructions, priority=0),
+            ],
+            llm.provider,
+            budget=llm.token_budget,
+            tag="audit_security",
+            reserve=count_tokens(context, llm.provider) + count_tokens(user_context, llm.provider),
+        )
 
-        response_json_str = await run_in_threadpool(
-            get_llm().generate,
+        response_json_str = await llm.agenerate(
             combined_prompt,
             context=context,
             user_context=user_context
@@ -112,12 +138,14 @@ async def audit_security():
         import traceback
         traceback.print_exc()
         # Fallback pour ne pas crasher si le JSON est malformé ou erreur quota
-        if "429" in str(e):
-             return {"error": "Quota Gemini dépassé (429). Attendez 1 minute.", "score": 0}
+        if isinstance(e, RateLimitError):
+            wait = f"{e.retry_after:.0f}s" if e.retry_after is not None else "1 minute"
+            return {"error": f"{e}. Attendez {wait}.", "score": 0}
         return {"error": f"Erreur analyse partielle : {str(e)}", "score": 0}
 
     report = {
         "score": score,
+        "prompt_tokens": usage["tokens"],
         "risks": [
             {
                 "severity": "critique", 
@@ -147,11 +175,15 @@ async def audit_security():
 
     print(f"Audit sécurité en {time.time() - start:.2f}s (Parallélisé)")
     
-    # Sauvegarde du Cache
+    # Sauvegarde du Cache (sauf rapport bâti sur le contexte générique du préchauffage RAG)
+    if is_degraded(context):
+        report["rag_degraded"] = True
+        return report
     try:
         with open(CACHE_FILE, "w") as f:
             json.dump({
                 "timestamp": time.time(),
+                "inputs": inputs,
                 "report": report
             }, f)
     except: pass
@@ -0,0 +1,140 @@
+# backend/src/semantic_cache.py - Cache sémantique des réponses du chatbot
+
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+from src import rag_setup, snapshot_store
+
+# Similarité cosinus minimale pour considérer deux questions comme équivalentes
+DEFAULT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+DEFAULT_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 500))
+DEFAULT_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 24 * 3600))               # 24 h
+# Datasets dont dépendent les réponses du chatbot. Les journaux renouvelés à chaque cycle du collecteur
+# (slow_queries, audit_trail, sql_deltas) en sont exclus : ils videraient le cache toutes les minutes.
+DATASETS = [name.strip() for name in os.getenv("SEMANTIC_CACHE_DATASETS", "users,roles,privs").split(",") if name.strip()]
+
+
+class SemanticCache:
+    """
+    Réponses indexées par l'embedding (normalisé) de la question : une nouvelle question
+    est servie depuis le cache si sa similarité cosinus avec une question déjà posée
+    dépasse `threshold`. Tout le cache est invalidé quand l'un des `datasets` ou le corpus RAG change.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL, datasets: list = None):
+        self.threshold = threshold
+        self.datasets = list(DATASETS if datasets is None else datasets)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors = None           # Matrice (max_entries, dim) en float32, allouée au premier ajout
+        self._questions = []
+        self._answers = []
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._last_hit = np.zeros(max_entries, dtype=np.float64)
+        self._size = 0
+        self._data_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        # Désactivé tant que le service RAG (qui porte le modèle d'embedding) n'est pas chargé
+        return rag_setup.rag.model is not None
+
+    def _embed(self, text: str) -> np.ndarray:
+        # Embedding partagé avec la recherche RAG (même question -> un seul passage dans le modèle)
+        return np.asarray(rag_setup.rag.embed(text), dtype=np.float32)
+
+    def _version(self) -> str:
+        # Empreintes des seuls datasets utilisés + version du corpus RAG (documentation ingérée)
+        h = hashlib.blake2b(digest_size=8)
+        for name, fingerprint in sorted(snapshot_store.fingerprints(self.datasets).items()):
+            h.update(f"{name}={fingerprint};".encode("utf-8"))
+        return f"{rag_setup.rag.corpus_version}:{h.hexdigest()}"
+
+    def _check_version(self, version: str):
+        # Appelé sous verrou : de nouvelles données rendent les anciennes réponses obsolètes
+        if version != self._data_version:
+            if self._size:
+                self.invalidations += 1
+            self._size = 0
+            self._questions, self._answers = [], []
+            self._data_version = version
+
+    def lookup(self, question: str):
+        """Retourne (réponse, similarité, question d'origine) ou None."""
+        if not self.enabled:
+            return None
+        vector = self._embed(question)
+        version = self._version()
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._size == 0:
+                self.misses += 1
+                return None
+            scores = self._vectors[:self._size] @ vector
+            scores[self._expires[:self._size] < now] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_hit[best] = now
+            self.hits += 1
+            return self._answers[best], float(scores[best]), self._questions[best]
+
+    def store(self, question: str, answer: str):
+        if not self.enabled:
+            return
+        vector = self._embed(question)
+        version = self._version()
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+            if self._size < self.max_entries:
+                pos = self._size
+                self._size += 1
+                self._questions.append(question)
+                self._answers.append(answer)
+            else:
+                # Cache plein : on remplace une entrée expirée, sinon la moins récemment servie
+                expired = np.flatnonzero(self._expires < now)
+                pos = int(expired[0]) if expired.size else int(np.argmin(self._last_hit))
+                self._questions[pos] = question
+                self._answers[pos] = answer
+            self._vectors[pos] = vector
+            self._expires[pos] = now + self.ttl
+            self._last_hit[pos] = now
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._questions, self._answers = [], []
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_sec": self.ttl,
+                "datasets": self.datasets,
+                "data_version": self._data_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "invalidations": self.invalidations,
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,107 @@
+# backend/src/single_flight.py - Dédoublonnage des appels identiques en cours (single-flight)
+
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """
+    Version threads : le premier appelant d'une clé exécute la fonction,
+    les appelants concurrents de la même clé attendent et reçoivent le même résultat (ou la même exception).
+    """
+
+    def __init__(self):
+        self._calls = {}       # clé -> _Call en cours
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "executed": self.executed, "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight:
+    """
+    Version asyncio : l'appel partagé tourne dans sa propre tâche, protégée par asyncio.shield,
+    si bien qu'un client qui se déconnecte n'annule pas la réponse attendue par les autres.
+    Quand le dernier appelant en attente est annulé (perdant d'une requête hedgée, timeout),
+    l'appel partagé est annulé aussi : il ne garde ni créneau du limiteur ni connexion pour personne.
+    """
+
+    def __init__(self):
+        self._tasks = {}       # clé -> asyncio.Task en cours
+        self._waiters = {}     # asyncio.Task -> nombre d'appelants en attente
+        self.executed = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, coro_fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(task) == 1 and not task.done():
+                # Retiré tout de suite : un appelant arrivé avant la fin de l'annulation lance un nouvel appel
+                if self._tasks.get(key) is task:
+                    del self._tasks[key]
+                task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            remaining = self._waiters.get(task, 1) - 1
+            if remaining:
+                self._waiters[task] = remaining
+            else:
+                self._waiters.pop(task, None)
+
+    def _finished(self, key: str, task):
+        if self._tasks.get(key) is task:
+            self._tasks.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Marque l'erreur comme lue même si tous les appelants sont partis
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._tasks), "executed": self.executed, "coalesced": self.coalesced,
+                "abandoned": self.abandoned}
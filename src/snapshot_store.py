@@ -0,0 +1,419 @@
+# backend/src/snapshot_store.py - Snapshots colonnaires typés des données extraites
+
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+# Gestion optionnelle de pyarrow (sinon repli sur CSV, comme avant)
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+SNAPSHOT_DIR = "data/snapshots"
+
+# Mode flotte : un espace de noms (sous-dossier) par base cible
+FLEET_DIR = "data/fleet"
+
+# Incrémenté à chaque changement incompatible du format : les snapshots plus anciens sont ignorés
+FORMAT_VERSION = "1"
+
+_manifest_lock = threading.Lock()
+
+# Au-delà de ce nombre de segments, les petits segments d'un journal en ajout sont regroupés
+# en segments d'au plus SEGMENT_ROWS lignes (les segments déjà pleins ne sont jamais réécrits)
+MAX_SEGMENTS = 64
+SEGMENT_ROWS = 50000
+
+# Rétention : au-delà, les segments les plus anciens d'un journal sont supprimés
+LOG_MAX_ROWS = int(os.getenv("SNAPSHOT_LOG_MAX_ROWS", 1000000))
+
+if HAS_ARROW:
+    SCHEMAS = {
+        "users": pa.schema([
+            ("username", pa.string()),
+            ("account_status", pa.string()),
+            ("profile", pa.string()),
+            ("created", pa.timestamp("us")),
+        ]),
+        "roles": pa.schema([
+            ("grantee", pa.string()),
+            ("granted_role", pa.string()),
+        ]),
+        "privs": pa.schema([
+            ("grantee", pa.string()),
+            ("privilege", pa.string()),
+        ]),
+        "slow_queries": pa.schema([
+            ("sql_id", pa.string()),
+            ("sql_text", pa.string()),
+            ("executions", pa.int64()),
+            ("elapsed_sec", pa.float64()),
+            ("disk_reads", pa.int64()),
+            ("buffer_gets", pa.int64()),
+        ]),
+        "audit_trail": pa.schema([
+            ("event_timestamp", pa.timestamp("us")),
+            ("dbusername", pa.string()),
+            ("action_name", pa.string()),
+            ("object_schema", pa.string()),
+            ("object_name", pa.string()),
+            ("sql_text", pa.string()),
+        ]),
+    }
+else:
+    SCHEMAS = {}
+
+
+def _extension() -> str:
+    return ".arrow" if HAS_ARROW else ".csv"
+
+
+def base_dir(namespace: str = None) -> str:
+    """Dossier des snapshots : data/snapshots pour la base principale, data/fleet/<cible> en mode flotte."""
+    if namespace is None:
+        return SNAPSHOT_DIR
+    return os.path.join(FLEET_DIR, namespace)
+
+
+def snapshot_path(name: str, namespace: str = None) -> str:
+    """Chemin du snapshot d'un dataset (fichier unique, réécrit à chaque extraction)."""
+    return os.path.join(base_dir(namespace), name + _extension())
+
+
+def _segment_dir(name: str, namespace: str = None) -> str:
+    return os.path.join(base_dir(namespace), name)
+
+
+def _to_arrow(name: str, df: pd.DataFrame, metadata: dict = None):
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    elif df.empty:
+        table = schema.empty_table()
+    else:
+        table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    if metadata is None:
+        metadata = {
+            b"format_version": FORMAT_VERSION.encode(),
+            b"dataset": name.encode(),
+            b"written_at": str(time.time()).encode(),
+        }
+    return table.replace_schema_metadata(metadata)
+
+
+def _chunk_digest(df: pd.DataFrame) -> bytes:
+    """Empreinte du contenu d'un lot (colonnes + valeurs, indépendante de l'index)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.digest()
+
+
+def _write_chunks(path: str, name: str, chunks, previous_fingerprint: str = None) -> tuple:
+    """
+    Ecrit un fichier à partir d'un itérable de DataFrames, lot par lot : la mémoire reste
+    bornée par la taille d'un lot. Ecriture atomique (fichier temporaire puis os.replace),
+    les lecteurs ne voient jamais un fichier partiel.
+    Le contenu est empreinté au fil de l'eau : s'il est identique à `previous_fingerprint`,
+    le fichier existant n'est pas remplacé (mtime et lecteurs inchangés).
+    Retourne (lignes, empreinte, modifié).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    rows = 0
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        if HAS_ARROW:
+            writer = None
+            schema = None
+            # IPC non compressé : lisible en memory-map sans copie
+            with pa.OSFile(tmp, "wb") as sink:
+                for df in chunks:
+                    digest.update(_chunk_digest(df))
+                    # Les lots suivants reprennent les métadonnées du 1er : le schéma du fichier ne varie pas
+                    table = _to_arrow(name, df, schema.metadata if schema is not None else None)
+                    if writer is None:
+                        schema = table.schema
+                        writer = ipc.new_file(sink, schema)
+                    writer.write_table(table)
+                    rows += len(df)
+                if writer is None:
+                    writer = ipc.new_file(sink, _to_arrow(name, pd.DataFrame()).schema)
+                writer.close()
+        else:
+            header = True
+            for df in chunks:
+                digest.update(_chunk_digest(df))
+                df.to_csv(tmp, index=False, header=header, mode="w" if header else "a")
+                header = False
+                rows += len(df)
+            if header:
+                pd.DataFrame().to_csv(tmp, index=False)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    fingerprint = digest.hexdigest()
+    if fingerprint == previous_fingerprint and os.path.exists(path):
+        os.remove(tmp)
+        return rows, fingerprint, False
+    os.replace(tmp, path)
+    return rows, fingerprint, True
+
+
+def _write_file(path: str, name: str, df: pd.DataFrame):
+    _write_chunks(path, name, [df])
+
+
+# -----------------------------------------------------------------------------
+# MANIFESTE : empreinte de chaque dataset et changements du dernier rafraîchissement
+# -----------------------------------------------------------------------------
+def _manifest_path(namespace: str = None) -> str:
+    return os.path.join(base_dir(namespace), "manifest.json")
+
+
+def load_manifest(namespace: str = None) -> dict:
+    try:
+        with open(_manifest_path(namespace), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"datasets": {}, "last_refresh": None}
+
+
+def _update_manifest(namespace: str, update):
+    """Lecture-modification-écriture atomique du manifeste (les étapes tournent en parallèle)."""
+    with _manifest_lock:
+        manifest = load_manifest(namespace)
+        update(manifest)
+        path = _manifest_path(namespace)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+
+
+def _record_dataset(namespace: str, name: str, fingerprint: str, rows: int, changed: bool):
+    now = time.time()
+
+    def update(manifest):
+        entry = manifest["datasets"].get(name, {})
+        entry.update({"fingerprint": fingerprint, "rows": rows, "checked_at": now})
+        if changed or "updated_at" not in entry:
+            entry["updated_at"] = now
+        manifest["datasets"][name] = entry
+
+    _update_manifest(namespace, update)
+
+
+def fingerprints(names: list, namespace: str = None) -> dict:
+    """Empreinte courante de chaque dataset (None s'il n'a jamais été extrait)."""
+    datasets = load_manifest(namespace)["datasets"]
+    return {name: datasets.get(name, {}).get("fingerprint") for name in names}
+
+
+def data_version(namespace: str = None) -> str:
+    """Version globale des données : change dès qu'un dataset change."""
+    datasets = load_manifest(namespace)["datasets"]
+    h = hashlib.blake2b(digest_size=8)
+    for name in sorted(datasets):
+        h.update(f"{name}={datasets[name].get('fingerprint')};".encode("utf-8"))
+    return h.hexdigest()
+
+
+def record_refresh(changed: list, unchanged: list, namespace: str = None):
+    """
+    Enregistre quels datasets ont changé lors du dernier rafraîchissement (lu par les analyseurs).
+    Fusion par dataset : une extraction partielle (ex. sql_deltas seul) ne modifie que ses propres entrées.
+    """
+    now = time.time()
+
+    def update(manifest):
+        previous = manifest.get("last_refresh") or {}
+        datasets = previous.get("datasets")
+        if datasets is None:  # Manifeste antérieur à la fusion par dataset
+            datasets = {name: {"changed": True, "at": previous.get("at")} for name in previous.get("changed", [])}
+            datasets.update({name: {"changed": False, "at": previous.get("at")} for name in previous.get("unchanged", [])})
+        datasets.update({name: {"changed": True, "at": now} for name in changed})
+        datasets.update({name: {"changed": False, "at": now} for name in unchanged})
+        manifest["last_refresh"] = {
+            "at": now,
+            "changed": sorted(name for name, entry in datasets.items() if entry["changed"]),
+            "unchanged": sorted(name for name, entry in datasets.items() if not entry["changed"]),
+            "datasets": datasets,
+        }
+
+    _update_manifest(namespace, update)
+
+
+def _check_format(schema, path: str):
+    if (schema.metadata or {}).get(b"format_version") != FORMAT_VERSION.encode():
+        raise ValueError(f"Snapshot {path} au format obsolète, relancez une extraction")
+
+
+def _read_file(path: str, columns: list = None):
+    if HAS_ARROW:
+        with pa.memory_map(path, "r") as source:
+            table = ipc.open_file(source).read_all()
+            _check_format(table.schema, path)
+            if columns:
+                table = table.select(columns)
+            return table.to_pandas()
+    return pd.read_csv(path, usecols=columns)
+
+
+def _read_file_tail(path: str, n: int, columns: list = None):
+    """Les `n` dernières lignes d'un fichier ; en mode Arrow, seuls les derniers lots sont convertis."""
+    if not HAS_ARROW:
+        return _read_file(path, columns).tail(n)
+    with pa.memory_map(path, "r") as source:
+        reader = ipc.open_file(source)
+        _check_format(reader.schema, path)
+        batches, rows = [], 0
+        for i in reversed(range(reader.num_record_batches)):
+            if rows >= n:
+                break
+            batch = reader.get_batch(i)
+            batches.append(batch.select(columns) if columns else batch)
+            rows += batch.num_rows
+        if not batches:
+            schema = reader.schema
+            return (schema.empty_table().select(columns) if columns else schema.empty_table()).to_pandas()
+        table = pa.Table.from_batches(list(reversed(batches)))
+        return table.slice(max(table.num_rows - n, 0)).to_pandas()
+
+
+def write_chunks(name: str, chunks, namespace: str = None) -> dict:
+    """
+    Remplace le snapshot du dataset `name` à partir d'un flux de DataFrames (extraction en streaming),
+    sauf si son contenu est inchangé. Retourne {"rows", "fingerprint", "changed"}.
+    """
+    previous = fingerprints([name], namespace)[name]
+    rows, fingerprint, changed = _write_chunks(snapshot_path(name, namespace), name, chunks, previous)
+    _record_dataset(namespace, name, fingerprint, rows, changed)
+    return {"rows": rows, "fingerprint": fingerprint, "changed": changed}
+
+
+def write_table(name: str, df: pd.DataFrame, namespace: str = None) -> dict:
+    """Remplace le snapshot du dataset `name` (sauf si son contenu est inchangé)."""
+    return write_chunks(name, [df], namespace)
+
+
+def read_table(name: str, columns: list = None, namespace: str = None) -> pd.DataFrame:
+    """
+    Charge un snapshot (memory-map + projection de colonnes si pyarrow est disponible).
+    Lève FileNotFoundError si le dataset n'a jamais été extrait.
+    """
+    return _read_file(snapshot_path(name, namespace), columns)
+
+
+# -----------------------------------------------------------------------------
+# JOURNAUX EN AJOUT (audit) : un segment par lot, compactés périodiquement
+# -----------------------------------------------------------------------------
+def _segments(name: str, namespace: str = None) -> list:
+    return sorted(glob.glob(os.path.join(_segment_dir(name, namespace), "part-*" + _extension())))
+
+
+def _segment_rows(part: str) -> int:
+    if HAS_ARROW:
+        with pa.memory_map(part, "r") as source:
+            reader = ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    with open(part, "r", encoding="utf-8") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def _compact(name: str, parts: list) -> int:
+    """
+    Regroupe les suites de petits segments consécutifs en segments d'au plus SEGMENT_ROWS lignes,
+    écrits (en flux) sous le nom du dernier segment du groupe : l'ordre d'écriture est conservé.
+    Retourne le nombre de segments supprimés.
+    """
+    groups, group, group_rows = [], [], 0
+    for part in parts:
+        rows = _segment_rows(part)
+        if group and group_rows + rows > SEGMENT_ROWS:
+            groups.append(group)
+            group, group_rows = [], 0
+        if rows >= SEGMENT_ROWS:
+            groups.append([part])  # Segment déjà plein : laissé tel quel
+            continue
+        group.append(part)
+        group_rows += rows
+    if group:
+        groups.append(group)
+
+    removed = 0
+    for group in groups:
+        if len(group) < 2:
+            continue
+        _write_chunks(group[-1], name, (_read_file(p) for p in group))
+        for p in group[:-1]:
+            os.remove(p)
+        removed += len(group) - 1
+    return removed
+
+
+def _apply_retention(name: str, namespace: str = None) -> int:
+    """Supprime les plus anciens segments tant que le journal dépasse LOG_MAX_ROWS. Retourne les lignes retirées."""
+    parts = _segments(name, namespace)
+    counts = [_segment_rows(p) for p in parts]
+    total, dropped = sum(counts), 0
+    for part, rows in zip(parts[:-1], counts):
+        if total - dropped <= LOG_MAX_ROWS:
+            break
+        os.remove(part)
+        dropped += rows
+    return dropped
+
+
+def append_rows(name: str, df: pd.DataFrame, namespace: str = None):
+    """Ajoute un lot de lignes au journal `name` sous forme d'un nouveau segment."""
+    if df.empty:
+        return
+    segment = os.path.join(_segment_dir(name, namespace), f"part-{time.time_ns():020d}{_extension()}")
+    _write_file(segment, name, df)
+
+    # Empreinte chaînée : celle du journal avant l'ajout + celle du nouveau lot
+    entry = load_manifest(namespace)["datasets"].get(name, {})
+    chained = hashlib.blake2b((entry.get("fingerprint") or "").encode() + _chunk_digest(df), digest_size=16)
+    rows = entry.get("rows", 0) + len(df)
+    _record_dataset(namespace, name, chained.hexdigest(), rows, True)
+
+    # Maintenance : le lot est déjà écrit et enregistré, un échec ici ne doit pas faire rejouer l'ajout
+    try:
+        parts = _segments(name, namespace)
+        if len(parts) > MAX_SEGMENTS:
+            _compact(name, parts)
+            dropped = _apply_retention(name, namespace)
+            if dropped:
+                _record_dataset(namespace, name, chained.hexdigest(), max(rows - dropped, 0), False)
+    except Exception as e:
+        print(f"Compaction du journal {name} en échec : {e}")
+
+
+def count_rows(name: str, namespace: str = None) -> int:
+    """Nombre total de lignes d'un journal (lecture des seuls en-têtes en mode Arrow)."""
+    return sum(_segment_rows(part) for part in _segments(name, namespace))
+
+
+def read_tail(name: str, n: int, columns: list = None, namespace: str = None) -> pd.DataFrame:
+    """Les `n` dernières lignes du journal, en ne lisant que les segments nécessaires."""
+    frames = []
+    remaining = n
+    for part in reversed(_segments(name, namespace)):
+        frames.append(_read_file_tail(part, remaining, columns))
+        remaining -= len(frames[-1])
+        if remaining <= 0:
+            break
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(reversed(frames), ignore_index=True)
@@ -0,0 +1,204 @@
+# backend/src/sql_sampler.py - Echantillonneur de deltas V$SQL (AWR-lite)
+
+import threading
+import time
+import numpy as np
+
+# Nombre de deltas (sql_id x intervalle) conservés avant écrasement des plus anciens
+RING_CAPACITY = 100_000
+
+# Métriques disponibles pour le classement des requêtes
+METRICS = ("elapsed_sec", "executions", "buffer_gets", "disk_reads")
+
+SAMPLE_QUERY = """
+    SELECT sql_id,
+           MAX(sql_text) AS sql_text,
+           SUM(executions) AS executions,
+           SUM(elapsed_time) AS elapsed_time,
+           SUM(buffer_gets) AS buffer_gets,
+           SUM(disk_reads) AS disk_reads
+    FROM v$sql
+    WHERE parsing_schema_name NOT IN ('SYS', 'SYSTEM')
+      AND executions > 0
+    GROUP BY sql_id
+"""
+
+
+class SqlDeltaSampler:
+    """
+    Diffe les snapshots cumulés successifs de V$SQL par sql_id et garde les deltas
+    par intervalle dans un buffer circulaire à base de tableaux NumPy.
+    Une ligne du buffer = (horodatage, sql_id, Δexecutions, Δelapsed, Δbuffer_gets, Δdisk_reads).
+    Les sql_id (et leur texte) ne sont conservés que tant qu'une ligne du buffer les référence ;
+    un changement de base cible repart de zéro (les compteurs cumulés de deux bases ne se soustraient pas).
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY):
+        self.capacity = capacity
+        self._ts = np.zeros(capacity, dtype=np.float64)
+        self._sql_idx = np.zeros(capacity, dtype=np.int32)
+        self._values = {
+            "executions": np.zeros(capacity, dtype=np.int64),
+            "elapsed_sec": np.zeros(capacity, dtype=np.float64),
+            "buffer_gets": np.zeros(capacity, dtype=np.int64),
+            "disk_reads": np.zeros(capacity, dtype=np.int64),
+        }
+        self.target = None
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._head = 0
+        self._size = 0
+        self._index = {}      # sql_id -> indice entier
+        self._sql_ids = []    # indice -> sql_id (None : indice libre)
+        self._refs = []       # indice -> nombre de lignes du buffer qui le référencent
+        self._free = []       # indices libérés, réutilisés avant d'en créer
+        self._texts = {}      # sql_id -> sql_text (sql_id présents dans le buffer uniquement)
+        self._previous = {}   # sql_id -> compteurs cumulés du dernier snapshot
+        self.last_sample = None
+
+    def _idx(self, sql_id: str) -> int:
+        idx = self._index.get(sql_id)
+        if idx is None:
+            if self._free:
+                idx = self._free.pop()
+                self._sql_ids[idx] = sql_id
+                self._refs[idx] = 0
+            else:
+                idx = len(self._sql_ids)
+                self._sql_ids.append(sql_id)
+                self._refs.append(0)
+            self._index[sql_id] = idx
+        return idx
+
+    def _release(self, idx: int):
+        # Ligne du buffer écrasée : le sql_id est oublié quand plus aucune ligne ne le référence
+        self._refs[idx] -= 1
+        if self._refs[idx] == 0:
+            sql_id = self._sql_ids[idx]
+            del self._index[sql_id]
+            self._texts.pop(sql_id, None)
+            self._sql_ids[idx] = None
+            self._free.append(idx)
+
+    def record(self, rows, ts: float = None, target: str = None) -> int:
+        """
+        Intègre un snapshot cumulé : itérable de (sql_id, sql_text, executions, elapsed_us, buffer_gets, disk_reads).
+        Le premier snapshot (ou le premier après un changement de `target`) sert uniquement de référence.
+        Retourne le nombre de deltas enregistrés.
+        """
+        ts = ts or time.time()
+        current = {}
+        recorded = 0
+        with self._lock:
+            if target is not None and target != self.target:
+                if self.target is not None:
+                    print(f"Echantillonneur V$SQL : nouvelle cible {target}, historique de {self.target} effacé")
+                self._reset()
+                self.target = target
+            first = self.last_sample is None
+            for sql_id, sql_text, executions, elapsed_us, buffer_gets, disk_reads in rows:
+                counters = (int(executions or 0), int(elapsed_us or 0), int(buffer_gets or 0), int(disk_reads or 0))
+                current[sql_id] = counters
+                if first:
+                    continue
+
+                prev = self._previous.get(sql_id, (0, 0, 0, 0))
+                delta = tuple(c - p for c, p in zip(counters, prev))
+                if any(d < 0 for d in delta):
+                    # Curseur vieilli puis rechargé : les compteurs sont repartis de zéro
+                    delta = counters
+                if delta[0] == 0 and delta[1] == 0:
+                    continue
+
+                pos = self._head
+                if self._size == self.capacity:
+                    self._release(int(self._sql_idx[pos]))
+                idx = self._idx(sql_id)
+                self._refs[idx] += 1
+                self._texts[sql_id] = sql_text
+                self._ts[pos] = ts
+                self._sql_idx[pos] = idx
+                self._values["executions"][pos] = delta[0]
+                self._values["elapsed_sec"][pos] = delta[1] / 1_000_000
+                self._values["buffer_gets"][pos] = delta[2]
+                self._values["disk_reads"][pos] = delta[3]
+                self._head = (pos + 1) % self.capacity
+                self._size = min(self._size + 1, self.capacity)
+                recorded += 1
+
+            self._previous = current
+            self.last_sample = ts
+            self.samples += 1
+        return recorded
+
+    def sample(self, conn) -> int:
+        """Prend un snapshot de V$SQL sur une connexion oracledb et enregistre les deltas."""
+        with conn.cursor() as cursor:
+            cursor.arraysize = 1000
+            cursor.execute(SAMPLE_QUERY)
+            # Identité de la base : un même échantillonneur resservi pour une autre cible repart de zéro
+            target = f"{getattr(conn, 'username', '')}@{getattr(conn, 'dsn', '')}"
+            return self.record(cursor.fetchall(), target=target)
+
+    def top(self, window_sec: float, metric: str = "elapsed_sec", limit: int = 5) -> list:
+        """Requêtes les plus chargées sur les `window_sec` dernières secondes, classées par `metric`."""
+        if metric not in METRICS:
+            raise ValueError(f"Métrique inconnue : {metric} (attendu : {', '.join(METRICS)})")
+
+        with self._lock:
+            n = self._size
+            mask = self._ts[:n] >= time.time() - window_sec
+            idx = self._sql_idx[:n][mask]
+            if idx.size == 0:
+                return []
+            minlength = len(self._sql_ids)
+            totals = {
+                name: np.bincount(idx, weights=values[:n][mask], minlength=minlength)
+                for name, values in self._values.items()
+            }
+            sql_ids = list(self._sql_ids)
+            texts = dict(self._texts)
+
+        ranking = np.argsort(totals[metric])[::-1][:limit]
+        results = []
+        for i in ranking:
+            if totals[metric][i] <= 0:
+                break
+            executions = int(totals["executions"][i])
+            elapsed = float(totals["elapsed_sec"][i])
+            results.append({
+                "sql_id": sql_ids[i],
+                "sql_text": texts.get(sql_ids[i], ""),
+                "executions": executions,
+                "elapsed_sec": round(elapsed, 3),
+                "elapsed_per_exec": round(elapsed / executions, 4) if executions else None,
+                "buffer_gets": int(totals["buffer_gets"][i]),
+                "disk_reads": int(totals["disk_reads"][i]),
+            })
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "samples": self.samples,
+                "deltas_buffered": self._size,
+                "capacity": self.capacity,
+                "distinct_sql_ids": len(self._index),
+                "target": self.target,
+                "last_sample": self.last_sample,
+            }
+
+
+_samplers = {}
+_samplers_lock = threading.Lock()
+
+
+def get_sampler(target: str = "default") -> SqlDeltaSampler:
+    """Echantillonneur associé à une cible (un buffer circulaire par base)."""
+    with _samplers_lock:
+        if target not in _samplers:
+            _samplers[target] = SqlDeltaSampler()
+        return _samplers[target]
@@ -0,0 +1,56 @@
+import sys
+import os
+import shutil
+import tempfile
+
+# Fix path
+sys.path.insert(0, os.path.abspath("."))
+
+import pandas as pd
+from src import snapshot_store
+
+# Snapshots écrits dans un dossier jetable, jamais dans data/
+workdir = tempfile.mkdtemp(prefix="verify_snapshots_")
+snapshot_store.SNAPSHOT_DIR = os.path.join(workdir, "snapshots")
+print(f"Format : {'Arrow' if snapshot_store.HAS_ARROW else 'CSV'} ({workdir})")
+
+try:
+    print("1. Ecriture en plusieurs lots...")
+    chunks = [
+        pd.DataFrame({"grantee": [f"U{i}" for i in range(start, start + 3)], "privilege": "CREATE SESSION"})
+        for start in (0, 3, 6)
+    ]
+    result = snapshot_store.write_chunks("privs", chunks)
+    assert result["rows"] == 9 and result["changed"], result
+    df = snapshot_store.read_table("privs")
+    assert list(df["grantee"]) == [f"U{i}" for i in range(9)], list(df["grantee"])
+    again = snapshot_store.write_chunks("privs", chunks)
+    assert not again["changed"] and again["fingerprint"] == result["fingerprint"], again
+    print("✅ 3 lots -> 9 lignes relues, réécriture identique ignorée")
+
+    print("2. Journal en ajout : compaction, rétention, lecture de la fin...")
+    snapshot_store.MAX_SEGMENTS, snapshot_store.SEGMENT_ROWS, snapshot_store.LOG_MAX_ROWS = 8, 20, 100
+    for i in range(60):
+        snapshot_store.append_rows("audit_trail", pd.DataFrame({
+            "event_timestamp": pd.to_datetime([1_700_000_000 + 2 * i, 1_700_000_001 + 2 * i], unit="s"),
+            "dbusername": [f"U{2 * i}", f"U{2 * i + 1}"],
+            "action_name": "LOGON", "object_schema": None, "object_name": None, "sql_text": None,
+        }))
+    parts = snapshot_store._segments("audit_trail")
+    total = snapshot_store.count_rows("audit_trail")
+    assert len(parts) <= snapshot_store.MAX_SEGMENTS + 1, len(parts)
+    assert all(snapshot_store._segment_rows(p) <= snapshot_store.SEGMENT_ROWS for p in parts)
+    assert snapshot_store.LOG_MAX_ROWS - snapshot_store.SEGMENT_ROWS <= total <= snapshot_store.LOG_MAX_ROWS, total
+    tail = snapshot_store.read_tail("audit_trail", 5, columns=["dbusername"])
+    assert list(tail["dbusername"]) == [f"U{i}" for i in range(115, 120)], list(tail["dbusername"])
+    assert snapshot_store.load_manifest()["datasets"]["audit_trail"]["rows"] == total
+    print(f"✅ 120 lignes ajoutées -> {len(parts)} segments, {total} lignes conservées, fin du journal dans l'ordre")
+
+    print("\n🎉 SNAPSHOT STORE OK")
+
+except Exception as e:
+    print(f"\n❌ SNAPSHOT STORE ERROR: {e!r}")
+    sys.exit(1)
+
+finally:
+    shutil.rmtree(workdir, ignore_errors=True)